@@ -0,0 +1,160 @@
+import argparse
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from decode import step
+from emulator import run
+from simulation import (
+    format_flags,
+    format_registers,
+    get_ip_register,
+    load_code,
+    reset_simulation,
+    set_ip_register,
+)
+from utils import find_listings
+
+
+class BatchResult(NamedTuple):
+    path: str
+    output: str
+    registers: Dict[str, int]
+    cycles: int
+    instructions: int
+    elapsed: float
+    error: Optional[str]
+
+
+BatchTask = Tuple[str, bool, bool, Optional[int]]
+
+
+def disassemble(code: bytes) -> List[str]:
+    reset_simulation()
+    load_code(code)
+    set_ip_register(0)
+
+    lines = []
+    while get_ip_register()[0] < len(code):
+        lines.append(step(False))
+    return lines
+
+
+def run_listing(task: BatchTask) -> BatchResult:
+    path, simulate, compiled, max_instructions = task
+    start = time.perf_counter()
+
+    try:
+        with open(path, "rb") as file:
+            code = file.read()
+
+        lines = [f"; {path}:", "bits 16"]
+        lines.extend(disassemble(code))
+
+        registers = {}
+        cycles = 0
+        instructions = 0
+        if simulate:
+            # run() resets the machine, so no state leaks between tasks
+            result = run(code, max_instructions, compiled)
+            registers = result.registers
+            cycles = result.cycles
+            instructions = result.instructions
+
+            lines.append("")
+            lines.append("Final registers:")
+            lines.extend(f"\t{line}" for line in format_registers())
+            flags_str = format_flags()
+            if flags_str:
+                lines.append(f"\tflags: {flags_str}")
+    except Exception as e:
+        return BatchResult(path, "", {}, 0, 0, time.perf_counter() - start, str(e))
+
+    output = "\n".join(lines) + "\n"
+    elapsed = time.perf_counter() - start
+    return BatchResult(path, output, registers, cycles, instructions, elapsed, None)
+
+
+def run_batch(
+    listings: List[str],
+    simulate: bool = False,
+    compiled: bool = False,
+    max_instructions: Optional[int] = None,
+    jobs: Optional[int] = None,
+) -> Iterator[BatchResult]:
+    tasks = [(path, simulate, compiled, max_instructions) for path in listings]
+
+    with Pool(jobs) as pool:
+        yield from pool.imap_unordered(run_listing, tasks)
+
+
+def format_result(result: BatchResult) -> str:
+    name = os.path.basename(result.path)
+    if result.error is not None:
+        return f"FAIL {name:<40} {result.error}"
+
+    return (
+        f"ok   {name:<40} {result.instructions:>10} instr "
+        f"{result.cycles:>10} cycles {result.elapsed * 1000:9.1f} ms"
+    )
+
+
+def format_summary(results: List[BatchResult], wall_time: float) -> List[str]:
+    failed = sum(1 for result in results if result.error is not None)
+    instructions = sum(result.instructions for result in results)
+    cycles = sum(result.cycles for result in results)
+    task_time = sum(result.elapsed for result in results)
+
+    lines = [
+        f"listings: {len(results)} ({len(results) - failed} ok, {failed} failed)",
+        f"instructions: {instructions}",
+        f"cycles: {cycles}",
+        f"task time: {task_time:.4f}s",
+        f"wall time: {wall_time:.4f}s",
+    ]
+    if wall_time:
+        lines.append(f"parallelism: {task_time / wall_time:.2f}x")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Batch Runner")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("-s", "--simulate", action="store_true")
+    parser.add_argument("-c", "--compile", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("-o", "--output-dir")
+    parser.add_argument("--max-steps", type=int, default=1000000)
+    args = parser.parse_args()
+
+    listings = find_listings(args.paths)
+    if not listings:
+        print("no listings found")
+        return
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    simulate = args.simulate or args.compile
+    results = []
+    start = time.perf_counter()
+    for result in run_batch(
+        listings, simulate, args.compile, args.max_steps, args.jobs
+    ):
+        results.append(result)
+        print(format_result(result), flush=True)
+
+        if args.output_dir and result.error is None:
+            name = os.path.basename(result.path) + ".out"
+            with open(os.path.join(args.output_dir, name), "w") as f:
+                f.write(result.output)
+    wall_time = time.perf_counter() - start
+
+    print()
+    for line in format_summary(results, wall_time):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,645 @@
+import argparse
+import os
+import tempfile
+import time
+
+from checkpoint import record_checkpoints, seek
+from compiler import COMPILER_STATS, clear_compiler_stats, run_compiled
+from debug import add_breakpoint, add_watchpoint, clear_debug_points, execute_debug
+from decode import step
+from emulator import execute, run
+from journal import Journal, run_journaled
+from decoder import (
+    IMM_TO_RM_OPCODE,
+    INSTRUCTION_TYPE_TO_OP_CODE,
+    LengthClass,
+    decode_next,
+    execute_instruction,
+    get_length_class,
+    get_local_op_code,
+    get_operands,
+    get_operation,
+)
+from simulation import (
+    DECODE_CACHE_STATS,
+    get_ip_register,
+    load_code,
+    reset_simulation,
+    set_ip_register,
+)
+from synth import generate, get_family, parse_mix
+from tracefile import run_traced
+from utils import PROBLEMS_DIR, InstructionType, find_listings
+
+
+def read_listing(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def report(label: str, count: int, elapsed: float):
+    rate = count / elapsed if elapsed else 0.0
+    print(f"{label:<24} {count:>10} in {elapsed:8.4f}s  {rate:>12,.0f}/s")
+
+
+# get_length_class and get_operation as they were before OPCODE_TABLE, kept
+# verbatim as the baseline of the decode benchmark
+def prefix_length_class(byte: int) -> LengthClass:
+    binary_string = f"{byte:08b}"
+
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV]):
+        return LengthClass.REG_MEM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_SEG_REG]
+    ):
+        return LengthClass.REG_MEM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_REG_SEG]
+    ):
+        return LengthClass.REG_MEM
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD]):
+        return LengthClass.REG_MEM
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB]):
+        return LengthClass.REG_MEM
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP]):
+        return LengthClass.REG_MEM
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM]):
+        return LengthClass.IMM_REG
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD_IMM_ACC]
+    ):
+        return LengthClass.ACC_IMM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB_IMM_ACC]
+    ):
+        return LengthClass.ACC_IMM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP_IMM_ACC]
+    ):
+        return LengthClass.ACC_IMM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM_MEM]
+    ):
+        return LengthClass.IMM_MEM
+    if binary_string.startswith(IMM_TO_RM_OPCODE):
+        return LengthClass.IMM_MEM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_MEM_ACC]
+    ):
+        return LengthClass.MEM_ACC
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_ACC_MEM]
+    ):
+        return LengthClass.ACC_MEM
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JE]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JL]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JLE]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JB]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JBE]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JP]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JO]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JS]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNE]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNL]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNLE]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNB]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNBE]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNP]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNO]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNS]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOP]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPZ]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPNZ]):
+        return LengthClass.JMP_SHORT
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JCXZ]):
+        return LengthClass.JMP_SHORT
+
+    raise Exception(f"unsupported op_code: {binary_string}")
+
+
+def prefix_operation(chunk: bytes) -> InstructionType:
+    byte0 = chunk[0]
+    binary_string = f"{byte0:08b}"
+
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM_MEM]
+    ):
+        return InstructionType.MOV_IMM_MEM
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_MEM_ACC]
+    ):
+        return InstructionType.MOV_MEM_ACC
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_ACC_MEM]
+    ):
+        return InstructionType.MOV_ACC_MEM
+    if binary_string.startswith(IMM_TO_RM_OPCODE):
+        local_op_code = get_local_op_code(chunk[1])
+        if local_op_code == 0b000:
+            return InstructionType.ADD_IMM_MEM
+        elif local_op_code == 0b101:
+            return InstructionType.SUB_IMM_MEM
+        elif local_op_code == 0b111:
+            return InstructionType.CMP_IMM_MEM
+        else:
+            raise Exception(f"unsupported local op_code: {local_op_code}")
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD_IMM_ACC]
+    ):
+        return InstructionType.ADD_IMM_ACC
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB_IMM_ACC]
+    ):
+        return InstructionType.SUB_IMM_ACC
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP_IMM_ACC]
+    ):
+        return InstructionType.CMP_IMM_ACC
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD]):
+        return InstructionType.ADD
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB]):
+        return InstructionType.SUB
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP]):
+        return InstructionType.CMP
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM]):
+        return InstructionType.MOV_IMM
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV]):
+        return InstructionType.MOV
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_SEG_REG]
+    ):
+        return InstructionType.MOV_SEG_REG
+    if binary_string.startswith(
+        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_REG_SEG]
+    ):
+        return InstructionType.MOV_REG_SEG
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JE]):
+        return InstructionType.JMP_JE
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JL]):
+        return InstructionType.JMP_JL
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JLE]):
+        return InstructionType.JMP_JLE
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JB]):
+        return InstructionType.JMP_JB
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JBE]):
+        return InstructionType.JMP_JBE
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JP]):
+        return InstructionType.JMP_JP
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JO]):
+        return InstructionType.JMP_JO
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JS]):
+        return InstructionType.JMP_JS
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNE]):
+        return InstructionType.JMP_JNE
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNL]):
+        return InstructionType.JMP_JNL
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNLE]):
+        return InstructionType.JMP_JNLE
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNB]):
+        return InstructionType.JMP_JNB
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNBE]):
+        return InstructionType.JMP_JNBE
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNP]):
+        return InstructionType.JMP_JNP
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNO]):
+        return InstructionType.JMP_JNO
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNS]):
+        return InstructionType.JMP_JNS
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOP]):
+        return InstructionType.LOOP
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPZ]):
+        return InstructionType.LOOPZ
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPNZ]):
+        return InstructionType.LOOPNZ
+    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JCXZ]):
+        return InstructionType.JCXZ
+
+    raise Exception(f"unsupported op_code: {binary_string}")
+
+
+def bench_decode(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+
+    count = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            load_code(code)
+            set_ip_register(0)
+            while get_ip_register()[0] < len(code):
+                step(False)
+                count += 1
+    report("decode + format", count, time.perf_counter() - start)
+
+    count = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            load_code(code)
+            set_ip_register(0)
+            current_ip = 0
+            while current_ip < len(code):
+                current_ip += decode_next().length
+                set_ip_register(current_ip)
+                count += 1
+    report("decode only", count, time.perf_counter() - start)
+
+    # classification as the decode loop did it before and after OPCODE_TABLE,
+    # on the instructions of the listings
+    chunks = []
+    for code in listings:
+        load_code(code)
+        set_ip_register(0)
+        current_ip = 0
+        while current_ip < len(code):
+            length = decode_next().length
+            chunks.append(code[current_ip : current_ip + length])
+            current_ip += length
+            set_ip_register(current_ip)
+
+    for chunk in chunks:
+        if (prefix_length_class(chunk[0]), prefix_operation(chunk)) != (
+            get_length_class(chunk[0]),
+            get_operation(chunk),
+        ):
+            raise Exception(f"classification differs for {chunk.hex()}")
+    chunks *= args.iterations
+
+    start = time.perf_counter()
+    for chunk in chunks:
+        prefix_length_class(chunk[0])
+        prefix_operation(chunk)
+    prefix_elapsed = time.perf_counter() - start
+    report("classify (prefix chains)", len(chunks), prefix_elapsed)
+
+    start = time.perf_counter()
+    for chunk in chunks:
+        get_length_class(chunk[0])
+        get_operation(chunk)
+    table_elapsed = time.perf_counter() - start
+    report("classify (table)", len(chunks), table_elapsed)
+    if table_elapsed:
+        print(f"table speedup: {prefix_elapsed / table_elapsed:.1f}x")
+
+
+def run_simulation(code: bytes, use_cache: bool, max_steps: int) -> int:
+    reset_simulation()
+    load_code(code)
+
+    steps = 0
+    current_ip = 0
+    while current_ip < len(code) and steps < max_steps:
+        instruction = decode_next(use_cache)
+        set_ip_register(current_ip + instruction.length)
+        execute_instruction(instruction)
+        current_ip, _ = get_ip_register()
+        steps += 1
+    return steps
+
+
+def bench_simulate(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+
+    for use_cache in (False, True):
+        count = 0
+        hits = 0
+        misses = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for code in listings:
+                count += run_simulation(code, use_cache, args.max_steps)
+                hits += DECODE_CACHE_STATS["hits"]
+                misses += DECODE_CACHE_STATS["misses"]
+        label = "simulate (cached)" if use_cache else "simulate (uncached)"
+        report(label, count, time.perf_counter() - start)
+        if use_cache:
+            print(f"decode cache: {hits} hits, {misses} misses")
+
+
+def bench_compile(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+
+    count = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            reset_simulation()
+            load_code(code)
+            steps = 0
+            while get_ip_register()[0] < len(code) and steps < args.max_steps:
+                step(True)
+                steps += 1
+            count += steps
+    interpreted = time.perf_counter() - start
+    report("simulate (trace)", count, interpreted)
+
+    count = 0
+    compiles = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            reset_simulation()
+            clear_compiler_stats()
+            load_code(code)
+            count += run_compiled(len(code), args.max_steps)
+            compiles += COMPILER_STATS["blocks"]
+    compiled = time.perf_counter() - start
+    report("simulate (compiled)", count, compiled)
+
+    print(f"blocks compiled: {compiles}")
+    if compiled:
+        print(f"speedup: {interpreted / compiled:.2f}x")
+
+
+def bench_headless(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+
+    count = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            reset_simulation()
+            load_code(code)
+            steps = 0
+            while get_ip_register()[0] < len(code) and steps < args.max_steps:
+                step(True)
+                steps += 1
+            count += steps
+    traced = time.perf_counter() - start
+    report("simulate (trace)", count, traced)
+
+    count = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            count += run(code, args.max_steps).instructions
+    headless = time.perf_counter() - start
+    report("simulate (headless)", count, headless)
+
+    if headless:
+        print(f"speedup: {traced / headless:.2f}x")
+
+
+def bench_trace(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+
+    count = 0
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for code in listings:
+            reset_simulation()
+            load_code(code)
+            steps = 0
+            while get_ip_register()[0] < len(code) and steps < args.max_steps:
+                step(True)
+                steps += 1
+            count += steps
+    text = time.perf_counter() - start
+    report("trace (text)", count, text)
+
+    count = 0
+    size = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.bin")
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for code in listings:
+                reset_simulation()
+                load_code(code)
+                count += run_traced(len(code), path, args.max_steps)
+        binary = time.perf_counter() - start
+        size = os.path.getsize(path)
+    report("trace (binary)", count, binary)
+    print(f"last trace file: {size} bytes")
+
+    if binary:
+        print(f"speedup: {text / binary:.2f}x")
+
+
+def bench_synth(args):
+    mix = parse_mix(args.mix) if args.mix else None
+    stream = generate(args.size, args.seed, mix)
+    print(f"{len(stream.lengths)} instructions, {len(stream.code)} bytes")
+
+    families = {}
+    offset = 0
+    for length, operation in zip(stream.lengths, stream.operations):
+        chunk = stream.code[offset : offset + length]
+        families.setdefault(get_family(operation), []).append((chunk, operation))
+        offset += length
+
+    print(f"{'family':<8} {'count':>8} {'class':>8} {'operation':>10} {'operands':>10}")
+    for family, items in sorted(families.items()):
+        chunks = [chunk for chunk, _ in items]
+
+        start = time.perf_counter_ns()
+        for chunk in chunks:
+            get_length_class(chunk[0])
+        classify = time.perf_counter_ns() - start
+
+        start = time.perf_counter_ns()
+        for chunk in chunks:
+            get_operation(chunk)
+        operation = time.perf_counter_ns() - start
+
+        start = time.perf_counter_ns()
+        for chunk, op in items:
+            get_operands(chunk, op, False)
+        operands = time.perf_counter_ns() - start
+
+        count = len(items)
+        print(
+            f"{family:<8} {count:>8} {classify / count:>8.1f} "
+            f"{operation / count:>10.1f} {operands / count:>10.1f}  ns/instr"
+        )
+
+
+def bench_journal(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+    journal = Journal(args.capacity)
+
+    def run_all(journaled: bool) -> int:
+        count = 0
+        for code in listings:
+            reset_simulation()
+            load_code(code)
+            if journaled:
+                journal.clear()
+                count += run_journaled(journal, len(code), args.max_steps)
+            else:
+                count += execute(len(code), args.max_steps)
+        return count
+
+    # the two modes alternate and the best pass of each is compared, so one
+    # noisy pass does not decide the slowdown
+    plain = journaled = float("inf")
+    count = 0
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        count = run_all(False)
+        plain = min(plain, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        run_all(True)
+        journaled = min(journaled, time.perf_counter() - start)
+
+    report("headless", count, plain)
+    report("headless + journal", count, journaled)
+    print(f"journal: {args.capacity} steps in {journal.size_in_bytes()} bytes")
+    print(f"slowdown over {len(listings)} listings: {journaled / plain:.2f}x")
+
+
+def bench_seek(args):
+    code = read_listing(find_listings(args.paths)[0])
+
+    reset_simulation()
+    load_code(code)
+    start = time.perf_counter()
+    index = record_checkpoints(code, args.interval)
+    total = index.checkpoints[-1].instructions
+    report("record checkpoints", total, time.perf_counter() - start)
+
+    targets = [total * (i + 1) // (args.seeks + 1) for i in range(args.seeks)]
+    for label, source in (("replay from 0", None), ("seek via checkpoint", index)):
+        count = 0
+        start = time.perf_counter()
+        for target in targets:
+            reset_simulation()
+            load_code(code)
+            count += seek(code, source, target)
+        report(label, count, time.perf_counter() - start)
+
+    pages = sum(len(checkpoint.pages) for checkpoint in index.checkpoints)
+    print(f"checkpoints: {len(index.checkpoints)} holding {pages} page copies")
+
+
+def bench_debug(args):
+    listings = [read_listing(path) for path in find_listings(args.paths)]
+
+    def measure(label: str, function) -> float:
+        count = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for code in listings:
+                reset_simulation()
+                load_code(code)
+                count += function(len(code), args.max_steps)
+        elapsed = time.perf_counter() - start
+        report(label, count, elapsed)
+        return elapsed
+
+    clear_debug_points()
+    # warm the decode paths so the first measurement is not penalized
+    for code in listings:
+        reset_simulation()
+        load_code(code)
+        execute(len(code), args.max_steps)
+    plain = measure("headless, nothing set", execute)
+
+    # never hit: the cost of checking the bitmap and the page filter
+    add_breakpoint(0xFFFF)
+    with_breakpoint = measure("debug loop + breakpoint", execute_debug)
+    clear_debug_points()
+
+    add_watchpoint(0xF0000, 0xF0002, read=True, write=True)
+    cold_watch = measure("watchpoint, cold page", execute)
+    clear_debug_points()
+
+    # every access to the listings' low page goes through the listener
+    add_watchpoint(0xFFE, 0x1000, read=True, write=True, callback=lambda hit: False)
+    hot_watch = measure("watchpoint, hot page", execute)
+    clear_debug_points()
+
+    if plain:
+        print(
+            f"overhead: breakpoint {with_breakpoint / plain:.2f}x, "
+            f"cold watch {cold_watch / plain:.2f}x, hot watch {hot_watch / plain:.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode_parser = subparsers.add_parser("decode")
+    decode_parser.add_argument("paths", nargs="*")
+    decode_parser.add_argument("-n", "--iterations", type=int, default=50)
+    decode_parser.set_defaults(func=bench_decode)
+
+    simulate_parser = subparsers.add_parser("simulate")
+    simulate_parser.add_argument("paths", nargs="*")
+    simulate_parser.add_argument("-n", "--iterations", type=int, default=1)
+    simulate_parser.add_argument("--max-steps", type=int, default=100000)
+    simulate_parser.set_defaults(func=bench_simulate)
+
+    compile_parser = subparsers.add_parser("compile")
+    compile_parser.add_argument("paths", nargs="*")
+    compile_parser.add_argument("-n", "--iterations", type=int, default=1)
+    compile_parser.add_argument("--max-steps", type=int, default=100000)
+    compile_parser.set_defaults(func=bench_compile)
+
+    headless_parser = subparsers.add_parser("headless")
+    headless_parser.add_argument("paths", nargs="*")
+    headless_parser.add_argument("-n", "--iterations", type=int, default=1)
+    headless_parser.add_argument("--max-steps", type=int, default=100000)
+    headless_parser.set_defaults(func=bench_headless)
+
+    trace_parser = subparsers.add_parser("trace")
+    trace_parser.add_argument("paths", nargs="*")
+    trace_parser.add_argument("-n", "--iterations", type=int, default=1)
+    trace_parser.add_argument("--max-steps", type=int, default=100000)
+    trace_parser.set_defaults(func=bench_trace)
+
+    synth_parser = subparsers.add_parser("synth")
+    synth_parser.add_argument("--size", type=int, default=4 * 1024 * 1024)
+    synth_parser.add_argument("--seed", type=int, default=0)
+    synth_parser.add_argument("--mix")
+    synth_parser.set_defaults(func=bench_synth)
+
+    journal_parser = subparsers.add_parser("journal")
+    journal_parser.add_argument("paths", nargs="*")
+    journal_parser.add_argument("-n", "--iterations", type=int, default=1)
+    journal_parser.add_argument("--max-steps", type=int, default=100000)
+    journal_parser.add_argument("--capacity", type=int, default=64 * 1024)
+    journal_parser.set_defaults(func=bench_journal)
+
+    debug_parser = subparsers.add_parser("debug")
+    debug_parser.add_argument("paths", nargs="*")
+    debug_parser.add_argument("-n", "--iterations", type=int, default=3)
+    debug_parser.add_argument("--max-steps", type=int, default=100000)
+    debug_parser.set_defaults(func=bench_debug)
+
+    seek_parser = subparsers.add_parser("seek")
+    seek_parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[os.path.join(PROBLEMS_DIR, "listing_0054_draw_rectangle")],
+    )
+    seek_parser.add_argument("--interval", type=int, default=1000)
+    seek_parser.add_argument("--seeks", type=int, default=10)
+    seek_parser.set_defaults(func=bench_seek)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
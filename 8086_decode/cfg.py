@@ -0,0 +1,171 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from decoder import (
+    INSTRUCTION_TYPE_TO_OP,
+    JUMP_TYPES,
+    Instruction,
+    decode_at,
+    format_instruction,
+)
+from simulation import get_code_byte
+
+
+class BasicBlock(NamedTuple):
+    start: int
+    end: int
+    instructions: List[Tuple[int, Instruction]]
+    # branch target first, then the fall-through
+    successors: List[int]
+    predecessors: List[int]
+
+
+class ControlFlowGraph(NamedTuple):
+    entry: int
+    code_length: int
+    blocks: Dict[int, BasicBlock]
+    # every decoded instruction by address
+    instructions: Dict[int, Instruction]
+    labels: Dict[int, str]
+
+
+def get_branch_target(ip: int, instruction: Instruction) -> int:
+    return (ip + instruction.length + instruction.immediate) & 0xFFFF
+
+
+def decode_reachable(
+    code_length: int, entries: List[int]
+) -> Tuple[Dict[int, Instruction], List[int]]:
+    instructions: Dict[int, Instruction] = {}
+    leaders = list(entries)
+    worklist = list(entries)
+
+    while worklist:
+        ip = worklist.pop()
+        while 0 <= ip < code_length and ip not in instructions:
+            try:
+                instruction = decode_at(ip)
+            except Exception:
+                # not code after all; leave the bytes to the data pass
+                break
+            if ip + instruction.length > code_length:
+                break
+
+            instructions[ip] = instruction
+            ip += instruction.length
+
+            if instruction.operation in JUMP_TYPES:
+                # every branch in this instruction set is conditional, so
+                # decoding carries on with the fall-through
+                target = get_branch_target(ip - instruction.length, instruction)
+                leaders.append(target)
+                leaders.append(ip)
+                worklist.append(target)
+
+    return instructions, leaders
+
+
+def build_cfg(code_length: int, entries: Optional[List[int]] = None) -> ControlFlowGraph:
+    if entries is None:
+        entries = [0]
+
+    instructions, leaders = decode_reachable(code_length, entries)
+    is_leader = bytearray(code_length + 1)
+    for leader in leaders:
+        if 0 <= leader < code_length and leader in instructions:
+            is_leader[leader] = 1
+
+    # one linear pass over the image splits the decoded code into blocks
+    block_instructions: Dict[int, List[Tuple[int, Instruction]]] = {}
+    current: Optional[List[Tuple[int, Instruction]]] = None
+    ip = 0
+    while ip < code_length:
+        instruction = instructions.get(ip)
+        if instruction is None:
+            current = None
+            ip += 1
+            continue
+
+        if current is None or is_leader[ip]:
+            current = block_instructions[ip] = []
+        current.append((ip, instruction))
+        ip += instruction.length
+
+        if instruction.operation in JUMP_TYPES:
+            current = None
+
+    blocks: Dict[int, BasicBlock] = {}
+    for start, members in block_instructions.items():
+        last_ip, last = members[-1]
+        end = last_ip + last.length
+        successors = []
+        if last.operation in JUMP_TYPES:
+            successors.append(get_branch_target(last_ip, last))
+        if end in block_instructions:
+            successors.append(end)
+        blocks[start] = BasicBlock(start, end, members, successors, [])
+
+    for block in blocks.values():
+        for successor in block.successors:
+            if successor in blocks:
+                blocks[successor].predecessors.append(block.start)
+
+    labels = {}
+    for ip, instruction in instructions.items():
+        if instruction.operation in JUMP_TYPES:
+            target = get_branch_target(ip, instruction)
+            # a target inside an instruction of the linear pass starts no
+            # block, so its label would never be printed
+            if target in blocks:
+                labels[target] = f"L{target:04x}"
+
+    return ControlFlowGraph(entries[0], code_length, blocks, instructions, labels)
+
+
+def format_branch(cfg: ControlFlowGraph, ip: int, instruction: Instruction) -> str:
+    target = get_branch_target(ip, instruction)
+    label = cfg.labels.get(target)
+    if label is None:
+        # not a block start: keep it relative
+        label = f"$+{target - ip}" if target >= ip else f"$-{ip - target}"
+    return f"{INSTRUCTION_TYPE_TO_OP[instruction.operation]} {label}"
+
+
+def format_listing(cfg: ControlFlowGraph) -> List[str]:
+    lines = []
+    data: List[str] = []
+    ip = 0
+    while ip < cfg.code_length:
+        instruction = cfg.instructions.get(ip)
+        if instruction is None:
+            data.append(f"{get_code_byte(ip):#04x}")
+            ip += 1
+            continue
+
+        if data:
+            lines.append(f"db {', '.join(data)}")
+            data = []
+
+        if ip in cfg.labels:
+            lines.append(f"{cfg.labels[ip]}:")
+        if instruction.operation in JUMP_TYPES:
+            lines.append(format_branch(cfg, ip, instruction))
+        else:
+            lines.append(format_instruction(instruction))
+        ip += instruction.length
+
+    if data:
+        lines.append(f"db {', '.join(data)}")
+    return lines
+
+
+def format_cfg(cfg: ControlFlowGraph) -> List[str]:
+    lines = []
+    for start in sorted(cfg.blocks):
+        block = cfg.blocks[start]
+        successors = ", ".join(f"{successor:#06x}" for successor in block.successors)
+        predecessors = ", ".join(f"{pred:#06x}" for pred in block.predecessors)
+        lines.append(
+            f"; block {block.start:#06x}-{block.end:#06x} "
+            f"({len(block.instructions)} instr) <- [{predecessors}] -> [{successors}]"
+        )
+    return lines
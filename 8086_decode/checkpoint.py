@@ -0,0 +1,196 @@
+import bisect
+import struct
+import zlib
+from typing import BinaryIO, Dict, List, NamedTuple, Optional
+
+import simulation
+from emulator import execute
+from simulation import (
+    PAGE_SHIFT,
+    PAGE_SIZE,
+    SIM_FLAGS,
+    SIM_REGISTERS,
+    get_cycles,
+    get_dirty_pages,
+    get_ip_register,
+    get_memory_view,
+    get_page_view,
+    pack_flags,
+    refresh_segment_bases,
+    restore_memory,
+)
+
+CHECKPOINT_MAGIC = b"8086CKP1"
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+# interval, page size, crc32 of the code, checkpoint count
+FILE_HEADER = struct.Struct("<IIII")
+# instructions, cycles, registers, packed flags, changed page count
+CHECKPOINT_HEADER = struct.Struct(f"<QQ{len(SIM_REGISTERS)}HBI")
+# page number, compressed size
+PAGE_HEADER = struct.Struct("<II")
+FLAG_NAMES = list(SIM_FLAGS)
+
+
+class Checkpoint(NamedTuple):
+    instructions: int
+    cycles: int
+    registers: tuple
+    flags: int
+    # page number -> zlib-compressed contents, only pages changed since the
+    # previous checkpoint
+    pages: Dict[int, bytes]
+
+
+class CheckpointIndex(NamedTuple):
+    interval: int
+    code_crc: int
+    checkpoints: List[Checkpoint]
+    # page number -> indices of the checkpoints that carry a copy of it
+    page_versions: Dict[int, List[int]]
+
+
+def capture_checkpoint(instructions: int, previous: bytearray) -> Checkpoint:
+    pages = {}
+    # pages never written since the reset are still zero, as in `previous`
+    for page in get_dirty_pages():
+        page_view = get_page_view(page)
+        offset = page << PAGE_SHIFT
+        if page_view != previous[offset : offset + len(page_view)]:
+            previous[offset : offset + len(page_view)] = page_view
+            pages[page] = zlib.compress(page_view)
+
+    return Checkpoint(
+        instructions, get_cycles(), tuple(SIM_REGISTERS), pack_flags(), pages
+    )
+
+
+def build_index(interval: int, code_crc: int, checkpoints: List[Checkpoint]) -> CheckpointIndex:
+    page_versions: Dict[int, List[int]] = {}
+    for number, checkpoint in enumerate(checkpoints):
+        for page in checkpoint.pages:
+            page_versions.setdefault(page, []).append(number)
+    return CheckpointIndex(interval, code_crc, checkpoints, page_versions)
+
+
+def record_checkpoints(
+    code: bytes, interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    max_instructions: Optional[int] = None,
+) -> CheckpointIndex:
+    # expects the code loaded into freshly reset memory
+    previous = bytearray(len(get_memory_view()))
+    checkpoints = []
+    instructions = 0
+    while True:
+        checkpoints.append(capture_checkpoint(instructions, previous))
+
+        budget = interval
+        if max_instructions is not None:
+            budget = min(budget, max_instructions - instructions)
+        steps = execute(len(code), budget) if budget > 0 else 0
+        instructions += steps
+        if steps < interval:
+            break
+
+    if instructions != checkpoints[-1].instructions:
+        checkpoints.append(capture_checkpoint(instructions, previous))
+    return build_index(interval, zlib.crc32(code), checkpoints)
+
+
+def write_checkpoints(file: BinaryIO, index: CheckpointIndex):
+    file.write(CHECKPOINT_MAGIC)
+    file.write(
+        FILE_HEADER.pack(index.interval, PAGE_SIZE, index.code_crc, len(index.checkpoints))
+    )
+    for checkpoint in index.checkpoints:
+        file.write(
+            CHECKPOINT_HEADER.pack(
+                checkpoint.instructions,
+                checkpoint.cycles,
+                *checkpoint.registers,
+                checkpoint.flags,
+                len(checkpoint.pages),
+            )
+        )
+        for page, data in checkpoint.pages.items():
+            file.write(PAGE_HEADER.pack(page, len(data)))
+            file.write(data)
+
+
+def read_checkpoints(file: BinaryIO) -> CheckpointIndex:
+    if file.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+        raise Exception("not an 8086 checkpoint file")
+
+    interval, page_size, code_crc, count = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+    if page_size != PAGE_SIZE:
+        raise Exception(f"unsupported checkpoint page size: {page_size}")
+
+    checkpoints = []
+    for _ in range(count):
+        fields = CHECKPOINT_HEADER.unpack(file.read(CHECKPOINT_HEADER.size))
+        instructions, cycles = fields[0], fields[1]
+        registers = fields[2 : 2 + len(SIM_REGISTERS)]
+        flags, page_count = fields[-2], fields[-1]
+
+        pages = {}
+        for _ in range(page_count):
+            page, size = PAGE_HEADER.unpack(file.read(PAGE_HEADER.size))
+            pages[page] = file.read(size)
+        checkpoints.append(Checkpoint(instructions, cycles, registers, flags, pages))
+
+    return build_index(interval, code_crc, checkpoints)
+
+
+def restore_checkpoint(index: CheckpointIndex, number: int):
+    checkpoint = index.checkpoints[number]
+    snapshot = {}
+    for page, versions in index.page_versions.items():
+        # the newest copy at or before this checkpoint; none means the page
+        # was still zero
+        position = bisect.bisect_right(versions, number) - 1
+        if position >= 0:
+            data = index.checkpoints[versions[position]].pages[page]
+            snapshot[page] = zlib.decompress(data)
+    restore_memory(snapshot)
+
+    SIM_REGISTERS[:] = checkpoint.registers
+    refresh_segment_bases()
+    for bit, key in enumerate(FLAG_NAMES):
+        SIM_FLAGS[key] = bool(checkpoint.flags & (1 << bit))
+    simulation.PENDING_FLAGS = None
+    simulation.SIM_CYCLES = checkpoint.cycles
+
+
+def find_checkpoint(
+    index: CheckpointIndex, instructions: Optional[int] = None, cycles: Optional[int] = None
+) -> int:
+    if instructions is not None:
+        keys = [checkpoint.instructions for checkpoint in index.checkpoints]
+        target = instructions
+    else:
+        keys = [checkpoint.cycles for checkpoint in index.checkpoints]
+        target = cycles
+    return max(bisect.bisect_right(keys, target) - 1, 0)
+
+
+def seek(
+    code: bytes,
+    index: Optional[CheckpointIndex],
+    instructions: Optional[int] = None,
+    cycles: Optional[int] = None,
+) -> int:
+    # returns the instruction count reached; replays at most one interval
+    if index is not None and index.code_crc != zlib.crc32(code):
+        raise Exception("checkpoint file was recorded for different code")
+
+    done = 0
+    if index is not None:
+        number = find_checkpoint(index, instructions, cycles)
+        restore_checkpoint(index, number)
+        done = index.checkpoints[number].instructions
+
+    if instructions is not None:
+        return done + execute(len(code), instructions - done)
+
+    while get_cycles() < cycles and get_ip_register()[0] < len(code):
+        done += execute(len(code), 1)
+    return done
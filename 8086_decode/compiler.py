@@ -0,0 +1,362 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import simulation
+from decoder import (
+    BRANCH_TABLE,
+    IMM_MEM_TYPES,
+    JUMP_TYPES,
+    REG_MEM_TYPES,
+    Instruction,
+    decode_at,
+    execute_instruction,
+    format_instruction,
+)
+from simulation import (
+    BRANCH_STATS,
+    CODE_WRITE_LISTENERS,
+    CX_INDEX,
+    DECODE_CACHE_STATS,
+    REGISTER_ALIASES,
+    FLAG_OP_ADD,
+    FLAG_OP_SUB,
+    ADDRESS_MASK,
+    R_M_BASE_INDICES,
+    SEG_REG_INDEX_BASE,
+    SEGMENT_BASES,
+    SIM_FLAGS,
+    SIM_REGISTERS,
+    estimate_clocks,
+    get_ip_register,
+    get_memory,
+    is_wide_reg,
+    materialize_flags,
+    set_ip_register,
+    set_memory,
+)
+from utils import InstructionType
+
+MOV_TYPES = (
+    InstructionType.MOV,
+    InstructionType.MOV_IMM,
+    InstructionType.MOV_IMM_MEM,
+    InstructionType.MOV_SEG_REG,
+    InstructionType.MOV_REG_SEG,
+)
+
+ADD_TYPES = (
+    InstructionType.ADD,
+    InstructionType.ADD_IMM_MEM,
+)
+
+SUB_TYPES = (
+    InstructionType.SUB,
+    InstructionType.SUB_IMM_MEM,
+)
+
+
+class CompiledBlock(NamedTuple):
+    start: int
+    end: int
+    instruction_count: int
+    # returns (next ip, instructions executed)
+    function: Callable[[], Tuple[int, int]]
+    source: str
+
+
+COMPILED_BLOCKS: Dict[int, CompiledBlock] = {}
+# block start ip -> number of times a block was compiled there
+BLOCK_COMPILE_COUNTS: Dict[int, int] = {}
+BLOCK_EXECUTION_COUNTS: Dict[int, int] = {}
+COMPILER_STATS: Dict[str, int] = {"blocks": 0, "interpreted": 0}
+
+
+def invalidate_blocks(loc: int, size: int):
+    for start in list(COMPILED_BLOCKS):
+        block = COMPILED_BLOCKS[start]
+        if loc < block.end and loc + size > block.start:
+            del COMPILED_BLOCKS[start]
+
+
+def clear_compiler_stats():
+    COMPILED_BLOCKS.clear()
+    BLOCK_COMPILE_COUNTS.clear()
+    BLOCK_EXECUTION_COUNTS.clear()
+    for key in COMPILER_STATS:
+        COMPILER_STATS[key] = 0
+
+
+CODE_WRITE_LISTENERS.append(invalidate_blocks)
+
+
+def reg_read(code: int) -> str:
+    index, shift, mask = REGISTER_ALIASES[code]
+    if mask == 0xFFFF:
+        return f"R[{index}]"
+    if shift:
+        return f"(R[{index}] >> 8)"
+    return f"(R[{index}] & 0xFF)"
+
+
+def reg_write(code: int, value: str) -> str:
+    index, shift, mask = REGISTER_ALIASES[code]
+    if mask == 0xFFFF:
+        return f"R[{index}] = {value} & 0xFFFF"
+    if shift:
+        return f"R[{index}] = (R[{index}] & 0x00FF) | (({value} & 0xFF) << 8)"
+    return f"R[{index}] = (R[{index}] & 0xFF00) | ({value} & 0xFF)"
+
+
+def flags_write(op: int, is_wide: bool) -> str:
+    # flags are only recorded here and materialized when a branch reads them
+    return f"sim.PENDING_FLAGS = ({op}, d, s, v, {is_wide})"
+
+
+def effective_address(instruction: Instruction) -> str:
+    modrm = instruction.modrm
+    if modrm.r_m_text is None:
+        offset = str(instruction.displacement)
+    else:
+        base_index, index_index = R_M_BASE_INDICES[modrm.r_m]
+        terms = [f"R[{base_index}]"]
+        if index_index is not None:
+            terms.append(f"R[{index_index}]")
+        if instruction.displacement:
+            terms.append(str(instruction.displacement))
+        offset = f"(({' + '.join(terms)}) & 0xFFFF)"
+    return f"(SB[{modrm.segment}] + {offset}) & {ADDRESS_MASK:#x}"
+
+
+def is_compilable(instruction: Instruction) -> bool:
+    operation = instruction.operation
+    modrm = instruction.modrm
+
+    if operation in JUMP_TYPES:
+        return True
+    if operation == InstructionType.MOV_IMM:
+        return True
+    if operation == InstructionType.MOV_IMM_MEM:
+        return modrm.mod != 0b11
+    if operation in IMM_MEM_TYPES:
+        return modrm.mod == 0b11
+    return operation in REG_MEM_TYPES
+
+
+def compile_instruction(
+    instruction: Instruction,
+) -> Tuple[List[str], Optional[str], int, bool]:
+    operation = instruction.operation
+    modrm = instruction.modrm
+    mod = modrm.mod if modrm is not None and operation != InstructionType.MOV_IMM else None
+    r_m = modrm.r_m if mod is not None else None
+    is_mem_dst = instruction.dst is None
+    cycles, _ = estimate_clocks(
+        operation, mod, r_m, is_mem_dst, instruction.displacement
+    )
+
+    lines = []
+    address = None
+    if mod is not None and mod != 0b11:
+        address = effective_address(instruction)
+        lines.append(f"a = {address}")
+
+    if is_mem_dst:
+        dst_value = "get_memory(a)"
+    else:
+        dst_value = reg_read(instruction.dst)
+
+    if instruction.immediate is not None:
+        src_value = str(instruction.immediate)
+    elif instruction.src is None:
+        src_value = "get_memory(a)"
+    else:
+        src_value = reg_read(instruction.src)
+
+    is_wide = is_mem_dst or is_wide_reg(instruction.dst)
+
+    flags = None
+    if operation in MOV_TYPES:
+        lines.append(f"v = {src_value}")
+    else:
+        lines.append(f"d = {dst_value}")
+        lines.append(f"s = {src_value}")
+        if operation in ADD_TYPES:
+            lines.append("v = d + s")
+            flags = flags_write(FLAG_OP_ADD, is_wide)
+        else:
+            lines.append("v = d - s")
+            flags = flags_write(FLAG_OP_SUB, is_wide)
+
+    is_cmp = operation in (InstructionType.CMP, InstructionType.CMP_IMM_MEM)
+    if not is_cmp:
+        if is_mem_dst:
+            lines.append("set_memory(a, v)")
+        else:
+            lines.append(reg_write(instruction.dst, "v"))
+            index = REGISTER_ALIASES[instruction.dst][0]
+            if index >= SEG_REG_INDEX_BASE:
+                segment = index - SEG_REG_INDEX_BASE
+                lines.append(f"SB[{segment}] = R[{index}] << 4")
+
+    return lines, flags, cycles, is_mem_dst and not is_cmp
+
+
+def build_block(start: int, code_length: int) -> List[Tuple[int, Instruction]]:
+    instructions = []
+    ip = start
+    while ip < code_length:
+        instruction = decode_at(ip, use_cache=True)
+        if not is_compilable(instruction):
+            break
+
+        instructions.append((ip, instruction))
+        ip += instruction.length
+        if instruction.operation in JUMP_TYPES:
+            break
+
+    return instructions
+
+
+def generate_block_source(instructions: List[Tuple[int, Instruction]]) -> str:
+    start = instructions[0][0]
+    body: List[Optional[str]] = ['inv = STATS["invalidations"]']
+    total_cycles = 0
+    # body index of the last flags write no exit has observed yet
+    pending_flags = None
+
+    for count, (ip, instruction) in enumerate(instructions, 1):
+        next_ip = ip + instruction.length
+        body.append(f"# {ip:#06x}: {format_instruction(instruction)}")
+
+        if instruction.operation in JUMP_TYPES:
+            if total_cycles:
+                body.append(f"sim.SIM_CYCLES += {total_cycles}")
+            branch = BRANCH_TABLE[instruction.operation]
+            if branch.decrements_cx:
+                body.append(f"R[{CX_INDEX}] = (R[{CX_INDEX}] - 1) & 0xFFFF")
+            if "cx" in branch.condition:
+                body.append(f"cx = R[{CX_INDEX}]")
+            if branch.reads_flags:
+                body.append("materialize_flags()")
+            body.append(f"S = B.get({ip})")
+            body.append("if S is None:")
+            body.append(f"    S = B[{ip}] = [0, 0]")
+            body.append(f"if {branch.condition}:")
+            body.append("    S[0] += 1")
+            target = (next_ip + instruction.immediate) & 0xFFFF
+            body.append(f"    return ({target}, {count})")
+            body.append("S[1] += 1")
+            body.append(f"return ({next_ip}, {count})")
+            break
+
+        lines, flags, cycles, writes_memory = compile_instruction(instruction)
+        body.extend(lines)
+        total_cycles += cycles
+
+        if flags is not None:
+            if pending_flags is not None:
+                # overwritten before anything could read it
+                body[pending_flags] = None
+            pending_flags = len(body)
+            body.append(flags)
+
+        if writes_memory:
+            # self-modifying write: leave the block so the next one is recompiled
+            body.append('if STATS["invalidations"] != inv:')
+            body.append(f"    sim.SIM_CYCLES += {total_cycles}")
+            body.append(f"    return ({next_ip}, {count})")
+            pending_flags = None
+    else:
+        if total_cycles:
+            body.append(f"sim.SIM_CYCLES += {total_cycles}")
+        body.append(f"return ({next_ip}, {len(instructions)})")
+
+    args = (
+        "R=R, F=F, STATS=STATS, sim=sim, get_memory=get_memory, "
+        "set_memory=set_memory, materialize_flags=materialize_flags, B=B, SB=SB"
+    )
+    lines = [f"def block_{start:04x}({args}):"]
+    lines.extend(f"    {line}" for line in body if line is not None)
+    return "\n".join(lines) + "\n"
+
+
+def compile_block(start: int, code_length: int) -> Optional[CompiledBlock]:
+    instructions = build_block(start, code_length)
+    if not instructions:
+        return None
+
+    source = generate_block_source(instructions)
+    namespace = {
+        "R": SIM_REGISTERS,
+        "F": SIM_FLAGS,
+        "STATS": DECODE_CACHE_STATS,
+        "sim": simulation,
+        "get_memory": get_memory,
+        "set_memory": set_memory,
+        "materialize_flags": materialize_flags,
+        "B": BRANCH_STATS,
+        "SB": SEGMENT_BASES,
+    }
+    exec(compile(source, f"<block {start:#06x}>", "exec"), namespace)
+
+    last_ip, last_instruction = instructions[-1]
+    block = CompiledBlock(
+        start,
+        last_ip + last_instruction.length,
+        len(instructions),
+        namespace[f"block_{start:04x}"],
+        source,
+    )
+
+    COMPILED_BLOCKS[start] = block
+    BLOCK_COMPILE_COUNTS[start] = BLOCK_COMPILE_COUNTS.get(start, 0) + 1
+    COMPILER_STATS["blocks"] += 1
+    return block
+
+
+def run_compiled(code_length: int, max_instructions: Optional[int] = None) -> int:
+    steps = 0
+    current_ip, _ = get_ip_register()
+
+    while current_ip < code_length:
+        if max_instructions is not None and steps >= max_instructions:
+            break
+
+        block = COMPILED_BLOCKS.get(current_ip)
+        if block is None:
+            block = compile_block(current_ip, code_length)
+
+        if (
+            block is not None
+            and max_instructions is not None
+            and steps + block.instruction_count > max_instructions
+        ):
+            # the block could overshoot the cap: finish one instruction at a time
+            block = None
+
+        if block is None:
+            instruction = decode_at(current_ip, use_cache=True)
+            set_ip_register(current_ip + instruction.length)
+            execute_instruction(instruction, trace=False)
+            COMPILER_STATS["interpreted"] += 1
+            steps += 1
+        else:
+            next_ip, executed = block.function()
+            set_ip_register(next_ip)
+            BLOCK_EXECUTION_COUNTS[current_ip] = BLOCK_EXECUTION_COUNTS.get(current_ip, 0) + 1
+            steps += executed
+
+        current_ip, _ = get_ip_register()
+
+    return steps
+
+
+def format_block_report() -> str:
+    lines = [
+        f"; compiled blocks: {COMPILER_STATS['blocks']}, "
+        f"interpreted instructions: {COMPILER_STATS['interpreted']}"
+    ]
+    for start in sorted(BLOCK_COMPILE_COUNTS):
+        compiles = BLOCK_COMPILE_COUNTS[start]
+        executions = BLOCK_EXECUTION_COUNTS.get(start, 0)
+        lines.append(f";   block {start:#06x}: compiled {compiles}x, executed {executions}x")
+    return "\n".join(lines)
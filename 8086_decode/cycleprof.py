@@ -0,0 +1,180 @@
+import argparse
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from cfg import build_cfg
+from decoder import decode_at, execute_instruction, format_instruction
+from simulation import (
+    RECORD_CYCLES,
+    RECORD_EA_CYCLES,
+    STEP_RECORD,
+    get_ip_register,
+    load_code,
+    reset_simulation,
+    set_ip_register,
+)
+
+# ip -> [executions, cycles, ea cycles]
+IP_PROFILE: Dict[int, List[int]] = {}
+
+
+class BlockProfile(NamedTuple):
+    start: int
+    executions: int
+    instructions: int
+    cycles: int
+    ea_cycles: int
+    # the profiled ips of the block, in address order
+    ips: List[int]
+
+
+def clear_cycle_profile():
+    IP_PROFILE.clear()
+
+
+def run_cycle_profile(code_length: int, max_instructions: Optional[int] = None) -> int:
+    steps = 0
+    current_ip, _ = get_ip_register()
+
+    while current_ip < code_length:
+        if max_instructions is not None and steps >= max_instructions:
+            break
+
+        instruction = decode_at(current_ip, use_cache=True)
+        set_ip_register(current_ip + instruction.length)
+
+        STEP_RECORD[RECORD_CYCLES] = 0
+        STEP_RECORD[RECORD_EA_CYCLES] = 0
+        execute_instruction(instruction, trace=False, record=True)
+
+        stats = IP_PROFILE.get(current_ip)
+        if stats is None:
+            stats = IP_PROFILE[current_ip] = [0, 0, 0]
+        stats[0] += 1
+        stats[1] += STEP_RECORD[RECORD_CYCLES]
+        stats[2] += STEP_RECORD[RECORD_EA_CYCLES]
+
+        current_ip, _ = get_ip_register()
+        steps += 1
+
+    return steps
+
+
+def get_block_starts(code_length: int, entry: int = 0) -> Dict[int, int]:
+    # ip -> start of its basic block; cfg.py splits at every branch target,
+    # so a jump into the middle of straight-line code starts a new block
+    # instead of counting the tail twice
+    graph = build_cfg(code_length, [entry])
+    block_starts = {}
+    for block in graph.blocks.values():
+        for ip, _ in block.instructions:
+            block_starts[ip] = block.start
+    # code the static pass could not reach stands alone
+    for ip in IP_PROFILE:
+        block_starts.setdefault(ip, ip)
+    return block_starts
+
+
+def get_block_profiles(code_length: int, entry: int = 0) -> List[BlockProfile]:
+    block_starts = get_block_starts(code_length, entry)
+    members: Dict[int, List[int]] = {}
+    for ip in sorted(IP_PROFILE):
+        members.setdefault(block_starts[ip], []).append(ip)
+
+    profiles = []
+    for start, ips in members.items():
+        totals = [sum(IP_PROFILE[ip][field] for ip in ips) for field in range(3)]
+        # every entry runs the first instruction exactly once
+        entries = IP_PROFILE[start][0] if start in IP_PROFILE else 0
+        profiles.append(BlockProfile(start, entries, *totals, ips))
+    return sorted(profiles, key=lambda block: -block.cycles)
+
+
+def format_ip_instruction(ip: int) -> str:
+    return format_instruction(decode_at(ip, use_cache=True))
+
+
+def format_hot_blocks(code_length: int, limit: int = 10) -> List[str]:
+    blocks = get_block_profiles(code_length)
+    total_cycles = sum(block.cycles for block in blocks) or 1
+
+    lines = [
+        f"{'block':<8} {'entries':>8} {'instr':>10} {'cycles':>10} "
+        f"{'%':>6} {'ea %':>6}"
+    ]
+    for block in blocks[:limit]:
+        ea_share = 100 * block.ea_cycles / block.cycles if block.cycles else 0.0
+        lines.append(
+            f"{block.start:#06x}   {block.executions:>8} {block.instructions:>10} "
+            f"{block.cycles:>10} {100 * block.cycles / total_cycles:>6.1f} "
+            f"{ea_share:>6.1f}"
+        )
+        for ip in block.ips:
+            executions, cycles, ea_cycles = IP_PROFILE[ip]
+            lines.append(
+                f"  {ip:#06x} {executions:>8} {cycles:>10} ({ea_cycles} ea)  "
+                f"{format_ip_instruction(ip)}"
+            )
+
+    return lines
+
+
+def format_hot_ips(limit: int = 10) -> List[str]:
+    total_cycles = sum(stats[1] for stats in IP_PROFILE.values()) or 1
+    hottest = sorted(IP_PROFILE.items(), key=lambda item: -item[1][1])
+
+    lines = [f"{'ip':<8} {'count':>8} {'cycles':>10} {'%':>6} {'ea':>8}  instruction"]
+    for ip, (executions, cycles, ea_cycles) in hottest[:limit]:
+        lines.append(
+            f"{ip:#06x}   {executions:>8} {cycles:>10} "
+            f"{100 * cycles / total_cycles:>6.1f} {ea_cycles:>8}  "
+            f"{format_ip_instruction(ip)}"
+        )
+    return lines
+
+
+def format_folded_stacks(code_length: int, root: str) -> List[str]:
+    block_starts = get_block_starts(code_length)
+    lines = []
+    for ip, (_, cycles, _) in sorted(IP_PROFILE.items()):
+        if not cycles:
+            continue
+        lines.append(
+            f"{root};block {block_starts[ip]:#06x};{ip:#06x} "
+            f"{format_ip_instruction(ip)} {cycles}"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Cycle Profiler")
+    parser.add_argument("file")
+    parser.add_argument("-n", "--limit", type=int, default=10)
+    parser.add_argument("--folded")
+    parser.add_argument("--max-steps", type=int)
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as file:
+        code = file.read()
+
+    reset_simulation()
+    load_code(code)
+    set_ip_register(0)
+    clear_cycle_profile()
+    steps = run_cycle_profile(len(code), args.max_steps)
+
+    print(f"; {args.file}: {steps} instructions")
+    for line in format_hot_blocks(len(code), args.limit):
+        print(line)
+    print()
+    for line in format_hot_ips(args.limit):
+        print(line)
+
+    if args.folded:
+        with open(args.folded, "w") as f:
+            for line in format_folded_stacks(len(code), os.path.basename(args.file)):
+                f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
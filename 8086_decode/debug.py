@@ -0,0 +1,202 @@
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from decoder import decode_at, execute_instruction
+from simulation import (
+    MEMORY_WATCH_LISTENERS,
+    PAGE_SHIFT,
+    SIM_MEMORY_SIZE,
+    WATCH_PAGES,
+    format_registers,
+    get_ip_register,
+    set_ip_register,
+)
+
+IP_SPACE = 0x10000
+
+
+class DebugHit(NamedTuple):
+    # "break", "read" or "write"
+    kind: str
+    ip: int
+    address: Optional[int]
+    value: Optional[int]
+
+
+# return True to stop the run; None as a callback always stops
+DebugCallback = Callable[[DebugHit], Optional[bool]]
+
+
+class Watchpoint(NamedTuple):
+    start: int
+    end: int
+    read: bool
+    write: bool
+    callback: Optional[DebugCallback]
+
+
+# one byte per ip, set where a breakpoint exists
+BREAKPOINTS = bytearray(IP_SPACE)
+BREAKPOINT_CALLBACKS: Dict[int, Optional[DebugCallback]] = {}
+WATCHPOINTS: List[Watchpoint] = []
+# [stop requested, inside a callback]
+DEBUG_STATE = [False, False]
+
+
+def has_debug_points() -> bool:
+    return bool(BREAKPOINT_CALLBACKS or WATCHPOINTS)
+
+
+def check_breakpoint(ip: int):
+    if not 0 <= ip < IP_SPACE:
+        raise Exception(f"breakpoint outside the 16-bit ip space: {ip:#x}")
+
+
+def add_breakpoint(ip: int, callback: Optional[DebugCallback] = None):
+    check_breakpoint(ip)
+    BREAKPOINTS[ip] = 1
+    BREAKPOINT_CALLBACKS[ip] = callback
+
+
+def remove_breakpoint(ip: int):
+    if 0 <= ip < IP_SPACE:
+        BREAKPOINTS[ip] = 0
+    BREAKPOINT_CALLBACKS.pop(ip, None)
+
+
+def refresh_watch_pages():
+    WATCH_PAGES[:] = bytes(len(WATCH_PAGES))
+    for watchpoint in WATCHPOINTS:
+        # a word starting just below the range still touches it
+        first = max(watchpoint.start - 1, 0) >> PAGE_SHIFT
+        last = (watchpoint.end - 1) >> PAGE_SHIFT
+        for page in range(first, last + 1):
+            WATCH_PAGES[page] = 1
+
+
+def check_watch_range(start: int, end: int):
+    if not 0 <= start < end <= SIM_MEMORY_SIZE:
+        raise Exception(f"watchpoint outside guest memory: {start:#x}-{end:#x}")
+
+
+def add_watchpoint(
+    start: int,
+    end: int,
+    read: bool = False,
+    write: bool = True,
+    callback: Optional[DebugCallback] = None,
+) -> Watchpoint:
+    # watches [start, end)
+    check_watch_range(start, end)
+    watchpoint = Watchpoint(start, end, read, write, callback)
+    WATCHPOINTS.append(watchpoint)
+    refresh_watch_pages()
+    return watchpoint
+
+
+def remove_watchpoint(watchpoint: Watchpoint):
+    WATCHPOINTS.remove(watchpoint)
+    refresh_watch_pages()
+
+
+def clear_debug_points():
+    BREAKPOINTS[:] = bytes(IP_SPACE)
+    BREAKPOINT_CALLBACKS.clear()
+    WATCHPOINTS.clear()
+    refresh_watch_pages()
+    DEBUG_STATE[0] = False
+
+
+def notify(callback: Optional[DebugCallback], hit: DebugHit) -> bool:
+    if callback is None:
+        return True
+    # accesses made by the callback itself do not trigger watchpoints
+    DEBUG_STATE[1] = True
+    try:
+        return bool(callback(hit))
+    finally:
+        DEBUG_STATE[1] = False
+
+
+def on_memory_access(loc: int, value: int, is_write: bool):
+    if DEBUG_STATE[1]:
+        return
+    for watchpoint in WATCHPOINTS:
+        if loc + 2 <= watchpoint.start or loc >= watchpoint.end:
+            continue
+        if not (watchpoint.write if is_write else watchpoint.read):
+            continue
+        # the ip register already points past the accessing instruction
+        _, ip = get_ip_register()
+        hit = DebugHit("write" if is_write else "read", ip, loc, value)
+        if notify(watchpoint.callback, hit):
+            DEBUG_STATE[0] = True
+
+
+MEMORY_WATCH_LISTENERS.append(on_memory_access)
+
+
+def hit_breakpoint(ip: int) -> bool:
+    return notify(BREAKPOINT_CALLBACKS.get(ip), DebugHit("break", ip, None, None))
+
+
+def take_stop_request() -> bool:
+    stop = DEBUG_STATE[0]
+    DEBUG_STATE[0] = False
+    return stop
+
+
+def execute_debug(
+    code_length: int, max_instructions: Optional[int] = None, resume: bool = False
+) -> int:
+    # emulator.execute with breakpoint and watchpoint stops; resuming skips
+    # the breakpoint the previous run stopped at
+    steps = 0
+    current_ip, _ = get_ip_register()
+    DEBUG_STATE[0] = False
+
+    while current_ip < code_length:
+        if max_instructions is not None and steps >= max_instructions:
+            break
+        # code past 64 KiB runs with an ip no breakpoint can name
+        if (
+            current_ip < IP_SPACE
+            and BREAKPOINTS[current_ip]
+            and (steps or not resume)
+        ):
+            if hit_breakpoint(current_ip):
+                break
+
+        instruction = decode_at(current_ip, use_cache=True)
+        set_ip_register(current_ip + instruction.length)
+        execute_instruction(instruction, trace=False)
+        current_ip, _ = get_ip_register()
+        steps += 1
+
+        if DEBUG_STATE[0]:
+            DEBUG_STATE[0] = False
+            break
+
+    return steps
+
+
+def format_hit(hit: DebugHit) -> List[str]:
+    if hit.kind == "break":
+        lines = [f"; breakpoint at {hit.ip:#06x}"]
+    else:
+        lines = [
+            f"; {hit.kind} [{hit.address:#07x}] = {hit.value:#06x} by {hit.ip:#06x}"
+        ]
+    lines.extend(f";\t{line}" for line in format_registers())
+    return lines
+
+
+def parse_watch(text: str) -> Watchpoint:
+    # start[-end][:r|w|rw], e.g. 0x100-0x4100:w; end defaults to start + 2
+    spec, _, mode = text.partition(":")
+    start_text, _, end_text = spec.partition("-")
+    start = int(start_text, 0)
+    end = int(end_text, 0) if end_text else start + 2
+    mode = mode or "w"
+    if set(mode) - {"r", "w"}:
+        raise Exception(f"bad watchpoint mode: {mode}")
+    return Watchpoint(start, end, "r" in mode, "w" in mode, None)
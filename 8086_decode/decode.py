@@ -1,81 +1,299 @@
 import argparse
+import mmap
 import sys
 
+from checkpoint import (
+    DEFAULT_CHECKPOINT_INTERVAL,
+    read_checkpoints,
+    record_checkpoints,
+    seek,
+    write_checkpoints,
+)
+from cfg import build_cfg, format_cfg, format_listing
+from compiler import format_block_report, run_compiled
+from emulator import execute
+from framebuffer import parse_framebuffer, run_framebuffer
+from instrument import enable_profiling, format_profile_report, write_profile_json
+from tracefile import run_traced
+from debug import (
+    BREAKPOINTS,
+    IP_SPACE,
+    DebugHit,
+    add_breakpoint,
+    add_watchpoint,
+    check_breakpoint,
+    check_watch_range,
+    execute_debug,
+    format_hit,
+    has_debug_points,
+    hit_breakpoint,
+    parse_watch,
+    take_stop_request,
+)
 from decoder import (
-    INSTRUCTION_TYPE_TO_OP,
-    get_additional_chunks,
-    get_length_class,
-    get_operands,
-    get_operation,
+    decode_next,
+    execute_instruction,
+    format_branch_report,
+    format_instruction,
 )
 from simulation import (
-    SIM_MEMORY,
-    SIM_REGISTERS,
+    PAGE_SHIFT,
+    SIM_MEMORY_SIZE,
     format_flags,
-    get_code_byte,
+    format_registers,
+    get_dirty_pages,
     get_ip_register,
+    get_memory_view,
+    get_page_view,
     load_code,
     set_ip_register,
+    use_memory,
 )
 
 
+def step(simulate: bool) -> str:
+    current_ip, _ = get_ip_register()
+    instruction = decode_next(use_cache=simulate)
+    set_ip_register(current_ip + instruction.length)
+
+    if simulate:
+        trace = execute_instruction(instruction)
+        return format_instruction(instruction) + trace
+
+    return format_instruction(instruction)
+
+
+def report_hit(hit: DebugHit) -> bool:
+    for line in format_hit(hit):
+        print(line)
+    # breakpoints stop the run, watchpoints only report
+    return hit.kind == "break"
+
+
+def open_dump_map(dump_file: str) -> mmap.mmap:
+    with open(dump_file, "w+b") as f:
+        f.truncate(SIM_MEMORY_SIZE)
+        return mmap.mmap(f.fileno(), SIM_MEMORY_SIZE, access=mmap.ACCESS_WRITE)
+
+
+def write_dump(dump_file: str):
+    # only written pages are stored; the rest stay holes that read as zero
+    with open(dump_file, "wb") as f:
+        for page in get_dirty_pages():
+            f.seek(page << PAGE_SHIFT)
+            f.write(get_page_view(page))
+        f.truncate(len(get_memory_view()))
+
+
 def main():
     parser = argparse.ArgumentParser(prog="8086 Decoder")
     parser.add_argument("-f", "--file")
     parser.add_argument("-s", "--simulate", action="store_true")
+    parser.add_argument("-c", "--compile", action="store_true")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    parser.add_argument("-t", "--trace-file")
     parser.add_argument(
         "-d",
         "--dump",
         action="store_true",
     )
+    parser.add_argument("-m", "--mmap", action="store_true")
+    parser.add_argument("-p", "--profile", nargs="?", const="-")
+    parser.add_argument("-b", "--branches", action="store_true")
+    parser.add_argument("-l", "--labels", action="store_true")
+    parser.add_argument("--cfg", action="store_true")
+    parser.add_argument("--checkpoints")
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_INTERVAL
+    )
+    parser.add_argument("--seek", type=int)
+    parser.add_argument("--seek-cycle", type=int)
+    # base,width,height[,rgba|rgb|gray]
+    parser.add_argument("--framebuffer")
+    parser.add_argument("--frames", default="frame.png")
+    parser.add_argument("--frame-every", type=int)
+    parser.add_argument("--break", dest="breakpoints", action="append", default=[])
+    # start[-end][:r|w|rw]
+    parser.add_argument("--watch", action="append", default=[])
     args = parser.parse_args()
 
     if args.file is None:
         print("no --file provided")
         sys.exit(1)
 
+    if args.breakpoints or args.watch:
+        # these modes run without breakpoint or watchpoint checks
+        for given, option in (
+            (args.compile, "-c"),
+            (args.trace_file is not None, "-t"),
+            (args.framebuffer is not None, "--framebuffer"),
+            (args.checkpoints is not None, "--checkpoints"),
+            (args.seek is not None, "--seek"),
+            (args.seek_cycle is not None, "--seek-cycle"),
+        ):
+            if given:
+                parser.error(f"--break and --watch cannot be used with {option}")
+
+    if args.labels or args.cfg:
+        # the listing is static and replaces the run
+        for given, option in (
+            (args.simulate, "-s"),
+            (args.compile, "-c"),
+            (args.quiet, "-q"),
+            (args.trace_file is not None, "-t"),
+            (args.framebuffer is not None, "--framebuffer"),
+            (args.checkpoints is not None, "--checkpoints"),
+            (args.seek is not None, "--seek"),
+            (args.seek_cycle is not None, "--seek-cycle"),
+            (bool(args.breakpoints), "--break"),
+            (bool(args.watch), "--watch"),
+        ):
+            if given:
+                parser.error(f"-l and --cfg cannot be used with {option}")
+
+    watches = []
+    try:
+        for ip in args.breakpoints:
+            check_breakpoint(int(ip, 0))
+        for text in args.watch:
+            watch = parse_watch(text)
+            check_watch_range(watch.start, watch.end)
+            watches.append(watch)
+    except Exception as error:
+        parser.error(str(error))
+
     with open(args.file, "rb") as file:
         print(f"; {file.name}:")
         print("bits 16")
 
-        code_bytes = file.read()
+        use_mmap = args.mmap and file.seek(0, 2) > 0
+        file.seek(0)
+
+        if use_mmap:
+            code_bytes = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            code_bytes = file.read()
         code_length = len(code_bytes)
 
-        load_code(code_bytes)
+        seeking = args.seek is not None or args.seek_cycle is not None
+        recording = args.checkpoints is not None and not seeking
+        headless = (
+            args.compile
+            or args.quiet
+            or args.trace_file is not None
+            or recording
+            or args.framebuffer is not None
+        )
+        dump_file = args.file + ".data"
+        dump_map = None
+        if use_mmap and args.dump:
+            # the simulator writes straight through to the dump file
+            dump_map = open_dump_map(dump_file)
+            use_memory(dump_map)
+            load_code(code_bytes)
+        elif use_mmap and not (args.simulate or headless):
+            # read-only disassembly decodes the mapped image in place
+            use_memory(code_bytes)
+        else:
+            load_code(code_bytes)
         set_ip_register(0)
 
-        while True:
+        if args.profile:
+            enable_profiling()
+
+        for ip in args.breakpoints:
+            add_breakpoint(int(ip, 0), report_hit)
+        for watch in watches:
+            add_watchpoint(watch.start, watch.end, watch.read, watch.write, report_hit)
+        debugging = (args.simulate or headless) and has_debug_points()
+        stopped = False
+
+        if seeking:
+            index = None
+            if args.checkpoints:
+                with open(args.checkpoints, "rb") as f:
+                    index = read_checkpoints(f)
+            # the selected mode carries on from the restored state
+            reached = seek(code_bytes, index, args.seek, args.seek_cycle)
+            print(f"; seek: {reached} instructions")
+
+        if recording:
+            index = record_checkpoints(code_bytes, args.checkpoint_every)
+            with open(args.checkpoints, "wb") as f:
+                write_checkpoints(f, index)
+        elif args.framebuffer:
+            framebuffer = parse_framebuffer(args.framebuffer)
+            for path in run_framebuffer(
+                code_length, framebuffer, args.frames, args.frame_every
+            ):
+                print(f"; frame: {path}")
+        elif args.compile:
+            run_compiled(code_length)
+            print(format_block_report())
+        elif args.trace_file:
+            run_traced(code_length, args.trace_file)
+        elif args.quiet and debugging:
+            execute_debug(code_length)
+            stopped = True
+        elif args.quiet:
+            execute(code_length)
+        elif args.labels or args.cfg:
+            graph = build_cfg(code_length)
+            for line in format_listing(graph):
+                print(line)
+            if args.cfg:
+                for line in format_cfg(graph):
+                    print(line)
+            set_ip_register(code_length)
+
+        while not stopped:
             current_ip, _ = get_ip_register()
 
             if current_ip >= code_length:
                 break
+            if (
+                debugging
+                and current_ip < IP_SPACE
+                and BREAKPOINTS[current_ip]
+                and hit_breakpoint(current_ip)
+            ):
+                break
 
-            chunk = bytes([get_code_byte(current_ip)])
-
-            length_class = get_length_class(chunk[0])
-            additional_chunk = get_additional_chunks(length_class)
-
-            if additional_chunk:
-                chunk += additional_chunk
+            print(step(args.simulate))
 
-            set_ip_register(current_ip + len(chunk))
-            operation = get_operation(chunk)
-            operands = get_operands(chunk, operation, args.simulate)
-            print(f"{INSTRUCTION_TYPE_TO_OP[operation]} {operands}")
+            if debugging and take_stop_request():
+                break
 
-        if args.simulate:
+        if args.simulate or headless:
             print("\nFinal registers:")
-            for key in SIM_REGISTERS:
-                val = SIM_REGISTERS[key]
-                print(f"\t{key}: {val:#06x} ({val})")
+            for line in format_registers():
+                print(f"\t{line}")
             flags_str = format_flags()
             if flags_str:
                 print(f"\tflags: {flags_str}")
 
-        if args.dump:
-            dump_file = args.file + ".data"
-            with open(dump_file, "wb") as f:
-                f.write(bytes(SIM_MEMORY))
+        if args.branches:
+            print()
+            for line in format_branch_report():
+                print(line)
+
+        if args.profile == "-":
+            print()
+            for line in format_profile_report():
+                print(line)
+        elif args.profile:
+            write_profile_json(args.profile)
+
+        if dump_map is not None:
+            dump_map.flush()
+            use_memory()
+            dump_map.close()
+        elif args.dump:
+            write_dump(dump_file)
+
+        if use_mmap:
+            use_memory()
+            code_bytes.close()
 
 
 if __name__ == "__main__":
@@ -1,13 +1,33 @@
 from enum import Enum
-from typing import Optional
+from typing import Callable, Dict, List, NamedTuple, Optional
 
 from simulation import (
     set_ip_register,
     update_simulation,
+    update_reg,
     get_ip_register,
+    ADDRESS_MASK,
+    BRANCH_STATS,
+    CX_INDEX,
+    DS_SEGMENT,
+    RECORD_KIND,
+    RECORD_REG,
+    RECORD_REG_NEW,
+    RECORD_REG_OLD,
+    R_M_SEGMENTS,
+    SEG_REG_OPERAND_BASE,
+    SEGMENT_BASES,
     SIM_FLAGS,
+    SIM_REGISTERS,
+    STEP_BRANCH,
+    STEP_RECORD,
+    STEP_REG_WRITE,
+    STEP_TAKEN,
+    cache_instruction,
     calc_effective_address,
+    get_cached_instruction,
     get_code_byte,
+    get_flags,
     grab_chunk_from_memory,
 )
 from utils import InstructionType, read_le16, to_signed
@@ -49,6 +69,13 @@ SEG_REG_LOOKUP = {
     0b011: "ds",
 }
 
+# indexed by operand code: REG_LOOKUP keys, then the segment registers
+OPERAND_NAMES = [REG_LOOKUP[key] for key in range(16)] + [
+    SEG_REG_LOOKUP[key] for key in range(4)
+]
+AL_OPERAND = 0b0000
+AX_OPERAND = 0b0001
+
 IMM_TO_RM_OPCODE = "100000"
 INSTRUCTION_TYPE_TO_OP_CODE = {
     InstructionType.MOV: "100010",
@@ -139,195 +166,110 @@ class LengthClass(str, Enum):
     JMP_SHORT = "JMP_SHORT"
 
 
-def get_length_class(byte: int) -> LengthClass:
+INSTRUCTION_TYPE_TO_LENGTH_CLASS = {
+    InstructionType.MOV: LengthClass.REG_MEM,
+    InstructionType.MOV_IMM: LengthClass.IMM_REG,
+    InstructionType.MOV_IMM_MEM: LengthClass.IMM_MEM,
+    InstructionType.MOV_MEM_ACC: LengthClass.MEM_ACC,
+    InstructionType.MOV_ACC_MEM: LengthClass.ACC_MEM,
+    InstructionType.ADD: LengthClass.REG_MEM,
+    InstructionType.ADD_IMM_MEM: LengthClass.IMM_MEM,
+    InstructionType.ADD_IMM_ACC: LengthClass.ACC_IMM,
+    InstructionType.SUB: LengthClass.REG_MEM,
+    InstructionType.SUB_IMM_MEM: LengthClass.IMM_MEM,
+    InstructionType.SUB_IMM_ACC: LengthClass.ACC_IMM,
+    InstructionType.CMP: LengthClass.REG_MEM,
+    InstructionType.CMP_IMM_MEM: LengthClass.IMM_MEM,
+    InstructionType.CMP_IMM_ACC: LengthClass.ACC_IMM,
+    InstructionType.JMP_JE: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JL: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JLE: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JB: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JBE: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JP: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JO: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JS: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNE: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNL: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNLE: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNB: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNBE: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNP: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNO: LengthClass.JMP_SHORT,
+    InstructionType.JMP_JNS: LengthClass.JMP_SHORT,
+    InstructionType.LOOP: LengthClass.JMP_SHORT,
+    InstructionType.LOOPZ: LengthClass.JMP_SHORT,
+    InstructionType.LOOPNZ: LengthClass.JMP_SHORT,
+    InstructionType.JCXZ: LengthClass.JMP_SHORT,
+    InstructionType.MOV_SEG_REG: LengthClass.REG_MEM,
+    InstructionType.MOV_REG_SEG: LengthClass.REG_MEM,
+}
+
+IMM_TO_RM_LOCAL_OP_CODE = {
+    0b000: InstructionType.ADD_IMM_MEM,
+    0b101: InstructionType.SUB_IMM_MEM,
+    0b111: InstructionType.CMP_IMM_MEM,
+}
+
+
+class OpcodeInfo(NamedTuple):
+    length_class: LengthClass
+    # None when the operation is selected by the reg field of the second byte
+    operation: Optional[InstructionType]
+    # bit positions within byte 0, None when the field is not encoded
+    w_bit: Optional[int]
+    d_bit: Optional[int]
+    s_bit: Optional[int]
+
+
+def build_opcode_info(byte: int) -> Optional[OpcodeInfo]:
     binary_string = f"{byte:08b}"
 
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV]):
-        return LengthClass.REG_MEM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_SEG_REG]
-    ):
-        return LengthClass.REG_MEM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_REG_SEG]
-    ):
-        return LengthClass.REG_MEM
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD]):
-        return LengthClass.REG_MEM
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB]):
-        return LengthClass.REG_MEM
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP]):
-        return LengthClass.REG_MEM
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM]):
-        return LengthClass.IMM_REG
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD_IMM_ACC]
-    ):
-        return LengthClass.ACC_IMM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB_IMM_ACC]
-    ):
-        return LengthClass.ACC_IMM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP_IMM_ACC]
-    ):
-        return LengthClass.ACC_IMM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM_MEM]
-    ):
-        return LengthClass.IMM_MEM
-    if binary_string.startswith(IMM_TO_RM_OPCODE):
-        return LengthClass.IMM_MEM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_MEM_ACC]
-    ):
-        return LengthClass.MEM_ACC
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_ACC_MEM]
-    ):
-        return LengthClass.ACC_MEM
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JE]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JL]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JLE]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JB]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JBE]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JP]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JO]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JS]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNE]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNL]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNLE]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNB]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNBE]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNP]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNO]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNS]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOP]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPZ]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPNZ]):
-        return LengthClass.JMP_SHORT
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JCXZ]):
-        return LengthClass.JMP_SHORT
-
-    raise Exception(f"unsupported op_code: {binary_string}")
+    for operation, op_code in INSTRUCTION_TYPE_TO_OP_CODE.items():
+        if not binary_string.startswith(op_code):
+            continue
+
+        length_class = INSTRUCTION_TYPE_TO_LENGTH_CLASS[operation]
+
+        if op_code == IMM_TO_RM_OPCODE:
+            return OpcodeInfo(length_class, None, 0, None, 1)
+        if operation in (InstructionType.MOV_SEG_REG, InstructionType.MOV_REG_SEG):
+            return OpcodeInfo(length_class, operation, None, None, None)
+        if length_class == LengthClass.REG_MEM:
+            return OpcodeInfo(length_class, operation, 0, 1, None)
+        if length_class == LengthClass.IMM_REG:
+            return OpcodeInfo(length_class, operation, 3, None, None)
+        if length_class == LengthClass.JMP_SHORT:
+            return OpcodeInfo(length_class, operation, None, None, None)
+
+        return OpcodeInfo(length_class, operation, 0, None, None)
+
+    return None
+
+
+OPCODE_TABLE: List[Optional[OpcodeInfo]] = [build_opcode_info(b) for b in range(256)]
+
+
+def get_opcode_info(byte: int) -> OpcodeInfo:
+    info = OPCODE_TABLE[byte]
+    if info is None:
+        raise Exception(f"unsupported op_code: {byte:08b}")
+    return info
+
+
+def get_length_class(byte: int) -> LengthClass:
+    return get_opcode_info(byte).length_class
 
 
 def get_operation(chunk: bytes) -> InstructionType:
-    byte0 = chunk[0]
-    binary_string = f"{byte0:08b}"
-
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM_MEM]
-    ):
-        return InstructionType.MOV_IMM_MEM
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_MEM_ACC]
-    ):
-        return InstructionType.MOV_MEM_ACC
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_ACC_MEM]
-    ):
-        return InstructionType.MOV_ACC_MEM
-    if binary_string.startswith(IMM_TO_RM_OPCODE):
-        local_op_code = get_local_op_code(chunk[1])
-        if local_op_code == 0b000:
-            return InstructionType.ADD_IMM_MEM
-        elif local_op_code == 0b101:
-            return InstructionType.SUB_IMM_MEM
-        elif local_op_code == 0b111:
-            return InstructionType.CMP_IMM_MEM
-        else:
-            raise Exception(f"unsupported local op_code: {local_op_code}")
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD_IMM_ACC]
-    ):
-        return InstructionType.ADD_IMM_ACC
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB_IMM_ACC]
-    ):
-        return InstructionType.SUB_IMM_ACC
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP_IMM_ACC]
-    ):
-        return InstructionType.CMP_IMM_ACC
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.ADD]):
-        return InstructionType.ADD
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.SUB]):
-        return InstructionType.SUB
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.CMP]):
-        return InstructionType.CMP
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_IMM]):
-        return InstructionType.MOV_IMM
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV]):
-        return InstructionType.MOV
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_SEG_REG]
-    ):
-        return InstructionType.MOV_SEG_REG
-    if binary_string.startswith(
-        INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.MOV_REG_SEG]
-    ):
-        return InstructionType.MOV_REG_SEG
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JE]):
-        return InstructionType.JMP_JE
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JL]):
-        return InstructionType.JMP_JL
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JLE]):
-        return InstructionType.JMP_JLE
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JB]):
-        return InstructionType.JMP_JB
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JBE]):
-        return InstructionType.JMP_JBE
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JP]):
-        return InstructionType.JMP_JP
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JO]):
-        return InstructionType.JMP_JO
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JS]):
-        return InstructionType.JMP_JS
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNE]):
-        return InstructionType.JMP_JNE
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNL]):
-        return InstructionType.JMP_JNL
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNLE]):
-        return InstructionType.JMP_JNLE
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNB]):
-        return InstructionType.JMP_JNB
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNBE]):
-        return InstructionType.JMP_JNBE
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNP]):
-        return InstructionType.JMP_JNP
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNO]):
-        return InstructionType.JMP_JNO
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JMP_JNS]):
-        return InstructionType.JMP_JNS
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOP]):
-        return InstructionType.LOOP
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPZ]):
-        return InstructionType.LOOPZ
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.LOOPNZ]):
-        return InstructionType.LOOPNZ
-    if binary_string.startswith(INSTRUCTION_TYPE_TO_OP_CODE[InstructionType.JCXZ]):
-        return InstructionType.JCXZ
-
-    raise Exception(f"unsupported op_code: {binary_string}")
+    operation = get_opcode_info(chunk[0]).operation
+    if operation is not None:
+        return operation
+
+    local_op_code = get_local_op_code(chunk[1])
+    if local_op_code not in IMM_TO_RM_LOCAL_OP_CODE:
+        raise Exception(f"unsupported local op_code: {local_op_code}")
+    return IMM_TO_RM_LOCAL_OP_CODE[local_op_code]
 
 
 def get_mod(byte: int) -> int:
@@ -338,20 +280,9 @@ def get_local_op_code(byte: int) -> int:
     return (byte >> 3) & 0b111
 
 
-def get_reg(d_bit: int, w_bit: int, destination: bool, byte: int) -> str:
-    target_bit_start = 3 if (destination == bool(d_bit)) else 0
-
-    reg_bits = (byte >> target_bit_start) & 0b111
-    key = (reg_bits << 1) | w_bit
-
-    return REG_LOOKUP[key]
-
-
-def get_reg_imm(w_bit: int, byte: int) -> str:
+def get_reg_imm(w_bit: int, byte: int) -> int:
     reg_bits = byte & 0b111
-    key = (reg_bits << 1) | w_bit
-
-    return REG_LOOKUP[key]
+    return (reg_bits << 1) | w_bit
 
 
 def format_memory_address(r_m_text: str, displacement: int) -> str:
@@ -364,386 +295,479 @@ def format_memory_address(r_m_text: str, displacement: int) -> str:
     return f"[{r_m_text} + {displacement}]"
 
 
-def format_imm_mem_operands(chunk: bytes, w_bit: int, immediate: int) -> str:
-    size_text = "word" if w_bit else "byte"
-    mod = get_mod(chunk[1])
-    r_m = chunk[1] & 0b111
+class ModRM(NamedTuple):
+    mod: int
+    reg: int
+    r_m: int
+    displacement_size: int
+    # None when the operand is a register (mod 11) or a direct address
+    r_m_text: Optional[str]
+    # SEGMENT_BASES index of the default segment
+    segment: int
 
-    if mod == 0b11:
-        reg_key = (r_m << 1) | w_bit
-        dst = REG_LOOKUP[reg_key]
-        return f"{dst}, {size_text} {immediate}"
-    elif mod == 0b00:
-        if r_m == 0b110:
-            displacement = read_le16(chunk[2], chunk[3])
-            return f"[{displacement}], {size_text} {immediate}"
-        else:
-            r_m_text = R_M_LOOKUP[r_m]
-            return f"{format_memory_address(r_m_text, 0)}, {size_text} {immediate}"
-    elif mod == 0b01:
-        r_m_text = R_M_LOOKUP[r_m]
-        displacement = to_signed(chunk[2] if r_m != 0b110 else 0, 8)
-        return (
-            f"{format_memory_address(r_m_text, displacement)}, {size_text} {immediate}"
-        )
-    elif mod == 0b10:
-        r_m_text = R_M_LOOKUP[r_m]
-        displacement = to_signed(read_le16(chunk[2], chunk[3]), 16)
-        return (
-            f"{format_memory_address(r_m_text, displacement)}, {size_text} {immediate}"
-        )
 
-    return ""
+def build_modrm(byte: int) -> ModRM:
+    mod = get_mod(byte)
+    reg = get_local_op_code(byte)
+    r_m = byte & 0b111
+    is_direct = mod == 0b00 and r_m == 0b110
 
+    if mod == 0b01:
+        displacement_size = 1
+    elif mod == 0b10 or is_direct:
+        displacement_size = 2
+    else:
+        displacement_size = 0
 
-def get_operands(
-    chunk: bytes, operation: InstructionType, simulate: Optional[bool]
-) -> str:
-    if operation in (
-        InstructionType.MOV,
-        InstructionType.ADD,
-        InstructionType.SUB,
-        InstructionType.CMP,
-        InstructionType.MOV_SEG_REG,
-        InstructionType.MOV_REG_SEG,
-    ):
-        mod = get_mod(chunk[1])
-        is_seg_reg = operation in (
-            InstructionType.MOV_SEG_REG,
-            InstructionType.MOV_REG_SEG,
-        )
-        seg_reg_bits = (chunk[1] >> 3) & 0b111 if is_seg_reg else None
-        seg_reg = SEG_REG_LOOKUP[seg_reg_bits] if is_seg_reg else None
+    r_m_text = None if mod == 0b11 or is_direct else R_M_LOOKUP[r_m]
+    segment = DS_SEGMENT if r_m_text is None else R_M_SEGMENTS[r_m]
+
+    return ModRM(mod, reg, r_m, displacement_size, r_m_text, segment)
 
-        if is_seg_reg:
+
+MODRM_TABLE: List[ModRM] = [build_modrm(b) for b in range(256)]
+
+
+def read_displacement(chunk: bytes, offset: int, modrm: ModRM) -> int:
+    if modrm.displacement_size == 1:
+        return to_signed(chunk[offset], 8)
+    if modrm.displacement_size == 2:
+        displacement = read_le16(chunk[offset], chunk[offset + 1])
+        if modrm.r_m_text is None:
+            return displacement
+        return to_signed(displacement, 16)
+    return 0
+
+
+def format_modrm_address(modrm: ModRM, displacement: int) -> str:
+    if modrm.r_m_text is None:
+        return f"[{displacement}]"
+    return format_memory_address(modrm.r_m_text, displacement)
+
+
+def get_modrm_effective_address(modrm: ModRM, displacement: int) -> int:
+    if modrm.r_m_text is None:
+        offset = displacement
+    else:
+        offset = calc_effective_address(modrm.r_m, displacement)
+    return (SEGMENT_BASES[modrm.segment] + offset) & ADDRESS_MASK
+
+
+REG_MEM_TYPES = (
+    InstructionType.MOV,
+    InstructionType.ADD,
+    InstructionType.SUB,
+    InstructionType.CMP,
+    InstructionType.MOV_SEG_REG,
+    InstructionType.MOV_REG_SEG,
+)
+
+SEG_REG_TYPES = (
+    InstructionType.MOV_SEG_REG,
+    InstructionType.MOV_REG_SEG,
+)
+
+ACC_IMM_TYPES = (
+    InstructionType.ADD_IMM_ACC,
+    InstructionType.SUB_IMM_ACC,
+    InstructionType.CMP_IMM_ACC,
+)
+
+IMM_MEM_TYPES = (
+    InstructionType.MOV_IMM_MEM,
+    InstructionType.ADD_IMM_MEM,
+    InstructionType.SUB_IMM_MEM,
+    InstructionType.CMP_IMM_MEM,
+)
+
+JUMP_TYPES = (
+    InstructionType.JMP_JE,
+    InstructionType.JMP_JL,
+    InstructionType.JMP_JLE,
+    InstructionType.JMP_JB,
+    InstructionType.JMP_JBE,
+    InstructionType.JMP_JP,
+    InstructionType.JMP_JO,
+    InstructionType.JMP_JS,
+    InstructionType.JMP_JNE,
+    InstructionType.JMP_JNL,
+    InstructionType.JMP_JNLE,
+    InstructionType.JMP_JNB,
+    InstructionType.JMP_JNBE,
+    InstructionType.JMP_JNP,
+    InstructionType.JMP_JNO,
+    InstructionType.JMP_JNS,
+    InstructionType.LOOP,
+    InstructionType.LOOPZ,
+    InstructionType.LOOPNZ,
+    InstructionType.JCXZ,
+)
+
+CX_OPERAND = 0b0011
+
+
+class BranchInfo(NamedTuple):
+    # python expression over the flags F and cx (after the LOOP decrement)
+    condition: str
+    decrements_cx: bool
+    reads_flags: bool
+    taken_cycles: int
+    not_taken_cycles: int
+    predicate: Callable[[Dict[str, bool], int], bool]
+
+
+def build_branch(
+    condition: str, decrements_cx: bool, taken_cycles: int, not_taken_cycles: int
+) -> BranchInfo:
+    predicate = eval(f"lambda F, cx: {condition}")
+    reads_flags = "F[" in condition
+    return BranchInfo(
+        condition, decrements_cx, reads_flags, taken_cycles, not_taken_cycles, predicate
+    )
+
+
+# one entry per branch opcode
+BRANCH_TABLE = {
+    InstructionType.JMP_JO: build_branch('F["O"]', False, 16, 4),
+    InstructionType.JMP_JNO: build_branch('not F["O"]', False, 16, 4),
+    InstructionType.JMP_JB: build_branch('F["C"]', False, 16, 4),
+    InstructionType.JMP_JNB: build_branch('not F["C"]', False, 16, 4),
+    InstructionType.JMP_JE: build_branch('F["Z"]', False, 16, 4),
+    InstructionType.JMP_JNE: build_branch('not F["Z"]', False, 16, 4),
+    InstructionType.JMP_JBE: build_branch('F["C"] or F["Z"]', False, 16, 4),
+    InstructionType.JMP_JNBE: build_branch('not (F["C"] or F["Z"])', False, 16, 4),
+    InstructionType.JMP_JS: build_branch('F["S"]', False, 16, 4),
+    InstructionType.JMP_JNS: build_branch('not F["S"]', False, 16, 4),
+    InstructionType.JMP_JP: build_branch('F["P"]', False, 16, 4),
+    InstructionType.JMP_JNP: build_branch('not F["P"]', False, 16, 4),
+    InstructionType.JMP_JL: build_branch('F["S"] != F["O"]', False, 16, 4),
+    InstructionType.JMP_JNL: build_branch('F["S"] == F["O"]', False, 16, 4),
+    InstructionType.JMP_JLE: build_branch('F["Z"] or F["S"] != F["O"]', False, 16, 4),
+    InstructionType.JMP_JNLE: build_branch(
+        'not F["Z"] and F["S"] == F["O"]', False, 16, 4
+    ),
+    InstructionType.LOOP: build_branch("cx != 0", True, 17, 5),
+    InstructionType.LOOPZ: build_branch('cx != 0 and F["Z"]', True, 18, 6),
+    InstructionType.LOOPNZ: build_branch('cx != 0 and not F["Z"]', True, 19, 5),
+    InstructionType.JCXZ: build_branch("cx == 0", False, 18, 6),
+}
+
+DIRECT_MODRM = MODRM_TABLE[0b00000110]
+
+
+class Instruction(NamedTuple):
+    operation: InstructionType
+    length: int
+    wide: bool
+    # register operand codes (see OPERAND_NAMES), None for the memory operand
+    # or the immediate
+    dst: Optional[int]
+    src: Optional[int]
+    modrm: Optional[ModRM]
+    displacement: int
+    # raw (sign-extended for the s bit) immediate, or the signed offset for jumps
+    immediate: Optional[int]
+
+
+def decode_instruction(chunk: bytes, operation: InstructionType) -> Instruction:
+    length = len(chunk)
+
+    if operation in REG_MEM_TYPES:
+        modrm = MODRM_TABLE[chunk[1]]
+
+        if operation in SEG_REG_TYPES:
             d_bit = operation == InstructionType.MOV_SEG_REG
             w_bit = 1
+            reg = SEG_REG_OPERAND_BASE + modrm.reg
+            r_m_reg = (modrm.r_m << 1) | 1
         else:
             d_bit = (chunk[0] >> 1) & 1
             w_bit = chunk[0] & 1
+            reg = (modrm.reg << 1) | w_bit
+            r_m_reg = (modrm.r_m << 1) | w_bit
 
-        if mod == 0b11:
-            if is_seg_reg:
-                r_m = chunk[1] & 0b111
-                gen_reg = REG_LOOKUP[(r_m << 1) | 1]
-                if d_bit:
-                    dst, src = seg_reg, gen_reg
-                else:
-                    dst, src = gen_reg, seg_reg
-            else:
-                dst = get_reg(d_bit, w_bit, True, chunk[1])
-                src = get_reg(d_bit, w_bit, False, chunk[1])
-
-            result = f"{dst}, {src}"
-            if simulate:
-                r_m = chunk[1] & 0b111
-                result += update_simulation(dst, operation, src=src, mod=mod, r_m=r_m)
-            return result
-        elif mod == 0b00:
-            r_m = chunk[1] & 0b111
-            if r_m == 0b110:
-                displacement = read_le16(chunk[2], chunk[3])
-                mem_addr = format_memory_address(str(displacement), 0)
-                effective_addr = displacement
-            else:
-                displacement = 0
-                r_m_text = R_M_LOOKUP[r_m]
-                mem_addr = format_memory_address(r_m_text, 0)
-                effective_addr = calc_effective_address(r_m, 0)
-
-            result = ""
-            if is_seg_reg:
-                if d_bit:
-                    result = f"{seg_reg}, {mem_addr}"
-                else:
-                    result = f"{mem_addr}, {seg_reg}"
-            else:
-                if d_bit:
-                    dst = get_reg(d_bit, w_bit, True, chunk[1])
-                    result = f"{dst}, {mem_addr}"
-
-                    if simulate:
-                        result += update_simulation(
-                            dst, operation, src=mem_addr, src_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-                        )
-                else:
-                    src = get_reg(d_bit, w_bit, False, chunk[1])
-                    result = f"{mem_addr}, {src}"
-
-                    if simulate:
-                        result += update_simulation(
-                            mem_addr, operation, src=src, dst_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-                        )
-
-            return result
-        elif mod == 0b01:
-            r_m = chunk[1] & 0b111
-            r_m_text = R_M_LOOKUP[r_m]
-            displacement = to_signed(chunk[2], 8)
-            mem_addr = format_memory_address(r_m_text, displacement)
-            effective_addr = calc_effective_address(r_m, displacement)
-
-            if is_seg_reg:
-                if d_bit:
-                    return f"{seg_reg}, {mem_addr}"
-                else:
-                    return f"{mem_addr}, {seg_reg}"
-            else:
-                if d_bit:
-                    dst = get_reg(d_bit, w_bit, True, chunk[1])
-                    result = f"{dst}, {mem_addr}"
-                    if simulate:
-                        result += update_simulation(
-                            dst, operation, src=mem_addr, src_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-                        )
-                    return result
-                else:
-                    src = get_reg(d_bit, w_bit, False, chunk[1])
-                    result = f"{mem_addr}, {src}"
-                    if simulate:
-                        result += update_simulation(
-                            mem_addr, operation, src=src, dst_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-                        )
-                    return result
-        elif mod == 0b10:
-            r_m = chunk[1] & 0b111
-            r_m_text = R_M_LOOKUP[r_m]
-            displacement = to_signed(read_le16(chunk[2], chunk[3]), 16)
-            mem_addr = format_memory_address(r_m_text, displacement)
-            effective_addr = calc_effective_address(r_m, displacement)
-
-            if is_seg_reg:
-                if d_bit:
-                    return f"{seg_reg}, {mem_addr}"
-                else:
-                    return f"{mem_addr}, {seg_reg}"
-            else:
-                if d_bit:
-                    dst = get_reg(d_bit, w_bit, True, chunk[1])
-                    result = f"{dst}, {mem_addr}"
-                    if simulate:
-                        result += update_simulation(
-                            dst, operation, src=mem_addr, src_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-                        )
-                    return result
-                else:
-                    src = get_reg(d_bit, w_bit, False, chunk[1])
-                    result = f"{mem_addr}, {src}"
-                    if simulate:
-                        result += update_simulation(
-                            mem_addr, operation, src=src, dst_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-                        )
-                    return result
+        if modrm.mod == 0b11:
+            displacement = 0
+        else:
+            displacement = read_displacement(chunk, 2, modrm)
+            r_m_reg = None
+
+        if d_bit:
+            dst, src = reg, r_m_reg
+        else:
+            dst, src = r_m_reg, reg
+
+        return Instruction(
+            operation, length, bool(w_bit), dst, src, modrm, displacement, None
+        )
 
     if operation == InstructionType.MOV_IMM:
         w_bit = (chunk[0] >> 3) & 1
         dst = get_reg_imm(w_bit, chunk[0])
         data = read_le16(chunk[1], chunk[2]) if w_bit else chunk[1]
-        immediate = to_signed(data, 16 if w_bit else 8)
-
-        result = f"{dst}, {immediate}"
-        if simulate:
-            result += update_simulation(dst, operation, immediate=data, mod=None, r_m=None)
-
-        return result
+        return Instruction(operation, length, bool(w_bit), dst, None, None, 0, data)
 
-    if operation in (
-        InstructionType.ADD_IMM_ACC,
-        InstructionType.SUB_IMM_ACC,
-        InstructionType.CMP_IMM_ACC,
-    ):
+    if operation in ACC_IMM_TYPES:
         w_bit = chunk[0] & 1
-        dst = "ax" if w_bit else "al"
+        dst = AX_OPERAND if w_bit else AL_OPERAND
         data = read_le16(chunk[1], chunk[2]) if w_bit else chunk[1]
-        immediate = to_signed(data, 16 if w_bit else 8)
+        return Instruction(operation, length, bool(w_bit), dst, None, None, 0, data)
 
-        return f"{dst}, {immediate}"
-
-    if operation == InstructionType.MOV_IMM_MEM:
+    if operation in IMM_MEM_TYPES:
         w_bit = chunk[0] & 1
-        if w_bit:
-            immediate_raw = read_le16(chunk[-2], chunk[-1])
-            immediate = to_signed(immediate_raw, 16)
-        else:
-            immediate_raw = chunk[-1]
-            immediate = to_signed(immediate_raw, 8)
-
-        mod = get_mod(chunk[1])
-        r_m = chunk[1] & 0b111
-
-        if mod == 0b00:
-            if r_m == 0b110:
-                displacement = read_le16(chunk[2], chunk[3])
-                effective_addr = displacement
-            else:
-                displacement = 0
-                effective_addr = calc_effective_address(r_m, 0)
-        elif mod == 0b01:
-            displacement = to_signed(chunk[2], 8)
-            effective_addr = calc_effective_address(r_m, displacement)
-        elif mod == 0b10:
-            displacement = to_signed(read_le16(chunk[2], chunk[3]), 16)
-            effective_addr = calc_effective_address(r_m, displacement)
-        else:
-            displacement = 0
-            effective_addr = None
-
-        result = format_imm_mem_operands(chunk, w_bit, immediate)
-        if simulate and effective_addr is not None:
-            result += update_simulation(
-                "", operation, immediate=immediate_raw, dst_addr=effective_addr, mod=mod, r_m=r_m, displacement=displacement
-            )
-        return result
-
-    if operation in (
-        InstructionType.ADD_IMM_MEM,
-        InstructionType.SUB_IMM_MEM,
-        InstructionType.CMP_IMM_MEM,
-    ):
-        op_byte = chunk[0]
-        w_bit = op_byte & 1
-        s_bit = (op_byte >> 1) & 1
+        s_bit = (chunk[0] >> 1) & 1 if operation != InstructionType.MOV_IMM_MEM else 0
         if w_bit and not s_bit:
-            immediate_raw = read_le16(chunk[-2], chunk[-1])
-            immediate = to_signed(immediate_raw, 16)
-            immediate_for_sim = immediate_raw
+            immediate = read_le16(chunk[-2], chunk[-1])
         elif w_bit and s_bit:
-            immediate_raw = chunk[-1]
-            immediate = to_signed(immediate_raw, 8)
-            immediate_for_sim = (
-                immediate_raw if immediate_raw < 128 else immediate_raw | 0xFF00
-            )
+            immediate = chunk[-1] if chunk[-1] < 128 else chunk[-1] | 0xFF00
         else:
-            immediate_raw = chunk[-1]
-            immediate = to_signed(immediate_raw, 8)
-            immediate_for_sim = immediate_raw
-
-        mod = get_mod(chunk[1])
-        r_m = chunk[1] & 0b111
-        if mod == 0b11:
-            reg_key = (r_m << 1) | w_bit
-            dst = REG_LOOKUP[reg_key]
+            immediate = chunk[-1]
+
+        modrm = MODRM_TABLE[chunk[1]]
+        if modrm.mod == 0b11:
+            dst = (modrm.r_m << 1) | w_bit
+            displacement = 0
         else:
             dst = None
+            displacement = read_displacement(chunk, 2, modrm)
 
-        result = format_imm_mem_operands(chunk, w_bit, immediate)
-        if simulate and dst:
-            result += update_simulation(dst, operation, immediate=immediate_for_sim, mod=mod, r_m=r_m)
-
-        return result
+        return Instruction(
+            operation, length, bool(w_bit), dst, None, modrm, displacement, immediate
+        )
 
     if operation == InstructionType.MOV_MEM_ACC:
         displacement = read_le16(chunk[1], chunk[2])
-        return f"ax, [{displacement}]"
+        return Instruction(
+            operation, length, True, AX_OPERAND, None, DIRECT_MODRM, displacement, None
+        )
 
     if operation == InstructionType.MOV_ACC_MEM:
         displacement = read_le16(chunk[1], chunk[2])
-        return f"[{displacement}], ax"
-
-    if operation in (
-        InstructionType.JMP_JE,
-        InstructionType.JMP_JL,
-        InstructionType.JMP_JLE,
-        InstructionType.JMP_JB,
-        InstructionType.JMP_JBE,
-        InstructionType.JMP_JP,
-        InstructionType.JMP_JO,
-        InstructionType.JMP_JS,
-        InstructionType.JMP_JNE,
-        InstructionType.JMP_JNL,
-        InstructionType.JMP_JNLE,
-        InstructionType.JMP_JNB,
-        InstructionType.JMP_JNBE,
-        InstructionType.JMP_JNP,
-        InstructionType.JMP_JNO,
-        InstructionType.JMP_JNS,
-        InstructionType.LOOP,
-        InstructionType.LOOPZ,
-        InstructionType.LOOPNZ,
-        InstructionType.JCXZ,
-    ):
+        return Instruction(
+            operation, length, True, None, AX_OPERAND, DIRECT_MODRM, displacement, None
+        )
+
+    if operation in JUMP_TYPES:
         offset = to_signed(chunk[1], 8)
-        if simulate:
-            current_ip, _ = get_ip_register()
-            if operation == InstructionType.JMP_JNE:
-                if not SIM_FLAGS["Z"]:
-                    set_ip_register(current_ip + offset)
-            elif operation == InstructionType.JMP_JE:
-                if SIM_FLAGS["Z"]:
-                    set_ip_register(current_ip + offset)
-            elif operation == InstructionType.JMP_JNS:
-                if not SIM_FLAGS["S"]:
-                    set_ip_register(current_ip + offset)
-            elif operation == InstructionType.JMP_JS:
-                if SIM_FLAGS["S"]:
-                    set_ip_register(current_ip + offset)
-        return f"{offset}"
+        return Instruction(operation, length, False, None, None, None, 0, offset)
 
     raise Exception(f"unsupported operation: {operation}")
 
 
-def get_additional_chunks(length_class: LengthClass) -> Optional[bytes]:
+def format_operand(instruction: Instruction, reg: Optional[int]) -> str:
+    if reg is not None:
+        return OPERAND_NAMES[reg]
+    return format_modrm_address(instruction.modrm, instruction.displacement)
+
+
+def format_operands(instruction: Instruction) -> str:
+    operation = instruction.operation
+
+    if operation in JUMP_TYPES:
+        return f"{instruction.immediate}"
+
+    dst = format_operand(instruction, instruction.dst)
+
+    if instruction.immediate is not None:
+        immediate = to_signed(instruction.immediate, 16 if instruction.wide else 8)
+        if operation in IMM_MEM_TYPES:
+            size_text = "word" if instruction.wide else "byte"
+            return f"{dst}, {size_text} {immediate}"
+        return f"{dst}, {immediate}"
+
+    return f"{dst}, {format_operand(instruction, instruction.src)}"
+
+
+def format_instruction(instruction: Instruction) -> str:
+    operation = instruction.operation
+    return f"{INSTRUCTION_TYPE_TO_OP[operation]} {format_operands(instruction)}"
+
+
+def execute_branch(instruction: Instruction, trace: bool, record: bool) -> str:
+    branch = BRANCH_TABLE[instruction.operation]
+    current_ip, _ = get_ip_register()
+
+    result = ""
+    cx = SIM_REGISTERS[CX_INDEX]
+    if branch.decrements_cx:
+        if record:
+            STEP_RECORD[RECORD_KIND] = STEP_REG_WRITE
+            STEP_RECORD[RECORD_REG] = CX_INDEX
+            STEP_RECORD[RECORD_REG_OLD] = cx
+            STEP_RECORD[RECORD_REG_NEW] = (cx - 1) & 0xFFFF
+        if trace:
+            result = update_reg(CX_OPERAND, cx - 1)
+        else:
+            SIM_REGISTERS[CX_INDEX] = (cx - 1) & 0xFFFF
+        cx = SIM_REGISTERS[CX_INDEX]
+
+    flags = get_flags() if branch.reads_flags else SIM_FLAGS
+    taken = branch.predicate(flags, cx)
+
+    branch_ip = current_ip - instruction.length
+    stats = BRANCH_STATS.get(branch_ip)
+    if stats is None:
+        stats = BRANCH_STATS[branch_ip] = [0, 0]
+
+    if taken:
+        stats[0] += 1
+        set_ip_register((current_ip + instruction.immediate) & 0xFFFF)
+    else:
+        stats[1] += 1
+    if record:
+        STEP_RECORD[RECORD_KIND] |= STEP_BRANCH | (STEP_TAKEN if taken else 0)
+    return result
+
+
+def format_branch_report() -> List[str]:
+    lines = [
+        f"{'branch':<8} {'instruction':<16} {'taken':>8} {'not':>8} "
+        f"{'cycles':>8} {'taken +':>8}"
+    ]
+    for ip in sorted(BRANCH_STATS):
+        taken, not_taken = BRANCH_STATS[ip]
+        instruction = decode_at(ip, use_cache=True)
+        branch = BRANCH_TABLE[instruction.operation]
+        cycles = taken * branch.taken_cycles + not_taken * branch.not_taken_cycles
+        # what the taken path cost over falling through
+        extra = taken * (branch.taken_cycles - branch.not_taken_cycles)
+        lines.append(
+            f"{ip:#06x}   {format_instruction(instruction):<16} {taken:>8} "
+            f"{not_taken:>8} {cycles:>8} {extra:>8}"
+        )
+    return lines
+
+
+def execute_instruction(
+    instruction: Instruction, trace: bool = True, record: bool = False
+) -> str:
+    operation = instruction.operation
+    modrm = instruction.modrm
+
+    if operation in JUMP_TYPES:
+        return execute_branch(instruction, trace, record)
+
+    if operation == InstructionType.MOV_IMM:
+        return update_simulation(
+            instruction.dst, operation, immediate=instruction.immediate, mod=None, r_m=None, trace=trace, record=record
+        )
+
+    if operation == InstructionType.MOV_IMM_MEM:
+        if modrm.mod == 0b11:
+            return ""
+        effective_addr = get_modrm_effective_address(modrm, instruction.displacement)
+        return update_simulation(
+            None, operation, immediate=instruction.immediate, dst_addr=effective_addr, mod=modrm.mod, r_m=modrm.r_m, displacement=instruction.displacement, trace=trace, record=record
+        )
+
+    if operation in IMM_MEM_TYPES:
+        if modrm.mod != 0b11:
+            return ""
+        return update_simulation(
+            instruction.dst, operation, immediate=instruction.immediate, mod=modrm.mod, r_m=modrm.r_m, trace=trace, record=record
+        )
+
+    if operation not in REG_MEM_TYPES:
+        return ""
+
+    if modrm.mod == 0b11:
+        return update_simulation(
+            instruction.dst, operation, src=instruction.src, mod=modrm.mod, r_m=modrm.r_m, trace=trace, record=record
+        )
+
+    effective_addr = get_modrm_effective_address(modrm, instruction.displacement)
+    if instruction.dst is not None:
+        return update_simulation(
+            instruction.dst, operation, src_addr=effective_addr, mod=modrm.mod, r_m=modrm.r_m, displacement=instruction.displacement, trace=trace, record=record
+        )
+    return update_simulation(
+        None, operation, src=instruction.src, dst_addr=effective_addr, mod=modrm.mod, r_m=modrm.r_m, displacement=instruction.displacement, trace=trace, record=record
+    )
+
+
+def get_operands(
+    chunk: bytes, operation: InstructionType, simulate: Optional[bool]
+) -> str:
+    instruction = decode_instruction(chunk, operation)
+    result = format_operands(instruction)
+    if simulate:
+        result += execute_instruction(instruction)
+    return result
+
+
+def decode_at(address: int, use_cache: bool = False) -> Instruction:
+    if use_cache:
+        instruction = get_cached_instruction(address)
+        if instruction is not None:
+            return instruction
+
+    chunk = bytes([get_code_byte(address)])
+
+    length_class = get_length_class(chunk[0])
+    additional_chunk = get_additional_chunks(length_class, address)
+
+    if additional_chunk:
+        chunk += additional_chunk
+
+    instruction = decode_instruction(chunk, get_operation(chunk))
+
+    if use_cache:
+        cache_instruction(address, instruction, instruction.length)
+
+    return instruction
+
+
+def decode_next(use_cache: bool = False) -> Instruction:
     current_ip, _ = get_ip_register()
+    return decode_at(current_ip, use_cache)
+
+
+def get_additional_chunks(
+    length_class: LengthClass, current_ip: Optional[int] = None
+) -> Optional[bytes]:
+    if current_ip is None:
+        current_ip, _ = get_ip_register()
     working_ip = current_ip + 1
 
     base_chunk = bytes([get_code_byte(current_ip)])
+    info = get_opcode_info(base_chunk[0])
     additional_chunk = b""
 
     if length_class == LengthClass.REG_MEM:
         chunk, working_ip = grab_chunk_from_memory(working_ip, 1)
         additional_chunk += chunk
 
-        mod = get_mod(additional_chunk[0])
-        if mod == 0b00:
-            r_m = additional_chunk[0] & 0b111
-            if r_m == 0b110:
-                chunk, working_ip = grab_chunk_from_memory(working_ip, 2)
-                additional_chunk += chunk
-        elif mod == 0b01:
-            chunk, working_ip = grab_chunk_from_memory(working_ip, 1)
-            additional_chunk += chunk
-        elif mod == 0b10:
-            chunk, working_ip = grab_chunk_from_memory(working_ip, 2)
+        displacement_size = MODRM_TABLE[chunk[0]].displacement_size
+        if displacement_size:
+            chunk, working_ip = grab_chunk_from_memory(working_ip, displacement_size)
             additional_chunk += chunk
     elif length_class == LengthClass.IMM_REG:
-        w_bit = (base_chunk[0] >> 3) & 1
+        w_bit = (base_chunk[0] >> info.w_bit) & 1
         amount_to_grab = 2 if w_bit else 1
         chunk, working_ip = grab_chunk_from_memory(working_ip, amount_to_grab)
         additional_chunk += chunk
     elif length_class == LengthClass.ACC_IMM:
-        w_bit = base_chunk[0] & 1
+        w_bit = (base_chunk[0] >> info.w_bit) & 1
         amount_to_grab = 2 if w_bit else 1
         chunk, working_ip = grab_chunk_from_memory(working_ip, amount_to_grab)
         additional_chunk += chunk
     elif length_class == LengthClass.IMM_MEM:
-        w_bit = base_chunk[0] & 1
-        binary_string = f"{base_chunk[0]:08b}"
+        w_bit = (base_chunk[0] >> info.w_bit) & 1
 
-        if binary_string.startswith(IMM_TO_RM_OPCODE):
-            s_bit = (base_chunk[0] >> 1) & 1
+        if info.s_bit is not None:
+            s_bit = (base_chunk[0] >> info.s_bit) & 1
             immediate_size = 1 if (w_bit and s_bit) or not w_bit else 2
         else:
             immediate_size = 2 if w_bit else 1
 
         chunk, working_ip = grab_chunk_from_memory(working_ip, 1)
         additional_chunk += chunk
-        mod = get_mod(additional_chunk[0])
-        if mod == 0b11:
-            chunk, working_ip = grab_chunk_from_memory(working_ip, immediate_size)
-            additional_chunk += chunk
-        elif mod == 0b00:
-            r_m = additional_chunk[0] & 0b111
-            if r_m == 0b110:
-                chunk, working_ip = grab_chunk_from_memory(working_ip, 2)
-                additional_chunk += chunk
-            chunk, working_ip = grab_chunk_from_memory(working_ip, immediate_size)
-            additional_chunk += chunk
-        elif mod == 0b01:
-            chunk, working_ip = grab_chunk_from_memory(working_ip, 1 + immediate_size)
-            additional_chunk += chunk
-        elif mod == 0b10:
-            chunk, working_ip = grab_chunk_from_memory(working_ip, 2 + immediate_size)
-            additional_chunk += chunk
+
+        displacement_size = MODRM_TABLE[chunk[0]].displacement_size
+        chunk, working_ip = grab_chunk_from_memory(
+            working_ip, displacement_size + immediate_size
+        )
+        additional_chunk += chunk
     elif length_class == LengthClass.MEM_ACC:
         chunk, working_ip = grab_chunk_from_memory(working_ip, 2)
         additional_chunk += chunk
@@ -0,0 +1,61 @@
+from typing import Dict, NamedTuple, Optional
+
+from compiler import run_compiled
+from decoder import decode_at, execute_instruction
+from simulation import (
+    REGISTER_INDEX,
+    SIM_REGISTERS,
+    get_cycles,
+    get_flags,
+    get_ip_register,
+    load_code,
+    reset_simulation,
+    set_ip_register,
+    snapshot_memory,
+)
+
+
+class RunResult(NamedTuple):
+    registers: Dict[str, int]
+    flags: Dict[str, bool]
+    cycles: int
+    instructions: int
+    # page number -> contents of every written page; the rest is zero
+    memory: Dict[int, bytes]
+
+
+def execute(code_length: int, max_instructions: Optional[int] = None) -> int:
+    steps = 0
+    current_ip, _ = get_ip_register()
+
+    while current_ip < code_length:
+        if max_instructions is not None and steps >= max_instructions:
+            break
+
+        instruction = decode_at(current_ip, use_cache=True)
+        set_ip_register(current_ip + instruction.length)
+        execute_instruction(instruction, trace=False)
+        current_ip, _ = get_ip_register()
+        steps += 1
+
+    return steps
+
+
+def run(
+    code: bytes, max_instructions: Optional[int] = None, compiled: bool = False
+) -> RunResult:
+    reset_simulation()
+    load_code(code)
+
+    if compiled:
+        steps = run_compiled(len(code), max_instructions)
+    else:
+        steps = execute(len(code), max_instructions)
+
+    return RunResult(
+        {name: SIM_REGISTERS[index] for name, index in REGISTER_INDEX.items()},
+        dict(get_flags()),
+        get_cycles(),
+        steps,
+        snapshot_memory(),
+    )
@@ -0,0 +1,148 @@
+import os
+import struct
+import zlib
+from typing import List, NamedTuple, Optional
+
+import simulation
+from emulator import execute
+from simulation import FRAMEBUFFER_RANGE, get_memory_view
+
+# bytes per pixel
+PIXEL_FORMATS = {"rgba": 4, "rgb": 3, "gray": 1}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COLOR_TYPES = {"rgba": 6, "rgb": 2, "gray": 0}
+
+
+class Framebuffer(NamedTuple):
+    base: int
+    width: int
+    height: int
+    pixel_format: str
+
+
+def parse_framebuffer(text: str) -> Framebuffer:
+    # base,width,height[,format], e.g. 0x100,64,64,rgba
+    fields = text.split(",")
+    if len(fields) not in (3, 4):
+        raise Exception(f"bad framebuffer spec: {text}")
+    pixel_format = fields[3] if len(fields) == 4 else "rgba"
+    if pixel_format not in PIXEL_FORMATS:
+        raise Exception(f"unknown pixel format: {pixel_format}")
+    return Framebuffer(int(fields[0], 0), int(fields[1]), int(fields[2]), pixel_format)
+
+
+def get_framebuffer_size(framebuffer: Framebuffer) -> int:
+    return framebuffer.width * framebuffer.height * PIXEL_FORMATS[framebuffer.pixel_format]
+
+
+def watch_framebuffer(framebuffer: Optional[Framebuffer]):
+    if framebuffer is None:
+        FRAMEBUFFER_RANGE[0] = FRAMEBUFFER_RANGE[1] = 0
+        return
+    FRAMEBUFFER_RANGE[0] = framebuffer.base
+    FRAMEBUFFER_RANGE[1] = framebuffer.base + get_framebuffer_size(framebuffer)
+
+
+def get_pixels(framebuffer: Framebuffer) -> memoryview:
+    end = framebuffer.base + get_framebuffer_size(framebuffer)
+    if end > len(get_memory_view()):
+        raise Exception(f"framebuffer end {end:#x} exceeds memory size")
+    return get_memory_view()[framebuffer.base : end]
+
+
+def encode_ppm(framebuffer: Framebuffer, pixels: memoryview) -> bytes:
+    header = f"{framebuffer.width} {framebuffer.height}\n255\n".encode()
+    if framebuffer.pixel_format == "gray":
+        return b"P5\n" + header + pixels.tobytes()
+    if framebuffer.pixel_format == "rgb":
+        return b"P6\n" + header + pixels.tobytes()
+
+    # PPM has no alpha channel
+    rgba = pixels.tobytes()
+    rgb = bytearray(len(rgba) // 4 * 3)
+    rgb[0::3] = rgba[0::4]
+    rgb[1::3] = rgba[1::4]
+    rgb[2::3] = rgba[2::4]
+    return b"P6\n" + header + rgb
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(data, zlib.crc32(kind))
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+def encode_png(framebuffer: Framebuffer, pixels: memoryview) -> bytes:
+    stride = framebuffer.width * PIXEL_FORMATS[framebuffer.pixel_format]
+    # filter type 0 in front of every row
+    rows = b"".join(
+        b"\x00" + pixels[y * stride : (y + 1) * stride] for y in range(framebuffer.height)
+    )
+    header = struct.pack(
+        ">IIBBBBB",
+        framebuffer.width,
+        framebuffer.height,
+        8,
+        PNG_COLOR_TYPES[framebuffer.pixel_format],
+        0,
+        0,
+        0,
+    )
+    return (
+        PNG_SIGNATURE
+        + png_chunk(b"IHDR", header)
+        + png_chunk(b"IDAT", zlib.compress(rows))
+        + png_chunk(b"IEND", b"")
+    )
+
+
+def write_frame(framebuffer: Framebuffer, path: str):
+    pixels = get_pixels(framebuffer)
+    if path.lower().endswith(".png"):
+        data = encode_png(framebuffer, pixels)
+    else:
+        data = encode_ppm(framebuffer, pixels)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def format_frame_path(pattern: str, number: int) -> str:
+    if "%" in pattern:
+        return pattern % number
+    root, ext = os.path.splitext(pattern)
+    return f"{root}_{number:04d}{ext}"
+
+
+def run_framebuffer(
+    code_length: int,
+    framebuffer: Framebuffer,
+    pattern: str,
+    every: Optional[int] = None,
+    max_instructions: Optional[int] = None,
+) -> List[str]:
+    # runs headless, checking every N instructions (or once at the end) and
+    # writing a frame only if the framebuffer was written since the last one
+    watch_framebuffer(framebuffer)
+    last_writes = simulation.FRAMEBUFFER_WRITES
+    paths: List[str] = []
+    steps = 0
+    try:
+        while True:
+            budget = every
+            if max_instructions is not None:
+                remaining = max_instructions - steps
+                budget = remaining if budget is None else min(budget, remaining)
+            count = execute(code_length, budget)
+            steps += count
+
+            if simulation.FRAMEBUFFER_WRITES != last_writes:
+                last_writes = simulation.FRAMEBUFFER_WRITES
+                path = pattern if every is None else format_frame_path(pattern, len(paths))
+                write_frame(framebuffer, path)
+                paths.append(path)
+
+            if not count or budget is None or count < budget:
+                break
+    finally:
+        watch_framebuffer(None)
+
+    return paths
@@ -0,0 +1,149 @@
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import decoder
+
+# hot-path functions timed per phase; they never call each other, so the
+# phase totals do not overlap
+PHASE_FUNCTIONS = {
+    "fetch": ("get_code_byte", "grab_chunk_from_memory"),
+    "classify": ("get_length_class", "get_operation"),
+    "decode": ("decode_instruction",),
+    "format": ("format_operands",),
+    "execute": ("execute_instruction",),
+}
+
+# [calls, nanoseconds]
+PHASE_STATS: Dict[str, List[int]] = {phase: [0, 0] for phase in PHASE_FUNCTIONS}
+OPERATION_STATS: Dict[str, List[int]] = {}
+
+# (module, name, original) for every patched reference
+PATCHES: List[Tuple[object, str, Callable]] = []
+PROFILE_START = 0
+
+
+def timed(stats: List[int], func: Callable) -> Callable:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        result = func(*args, **kwargs)
+        stats[1] += time.perf_counter_ns() - start
+        stats[0] += 1
+        return result
+
+    return wrapper
+
+
+def timed_execute(stats: List[int], func: Callable) -> Callable:
+    def wrapper(instruction, *args, **kwargs):
+        start = time.perf_counter_ns()
+        result = func(instruction, *args, **kwargs)
+        elapsed = time.perf_counter_ns() - start
+        stats[1] += elapsed
+        stats[0] += 1
+
+        operation = OPERATION_STATS.get(instruction.operation)
+        if operation is None:
+            operation = OPERATION_STATS[instruction.operation] = [0, 0]
+        operation[0] += 1
+        operation[1] += elapsed
+        return result
+
+    return wrapper
+
+
+def patch_everywhere(original: Callable, wrapper: Callable):
+    # callers hold their own `from decoder import ...` references, so every
+    # loaded module that refers to the function gets the wrapper
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, "__dict__", None)
+        if namespace is None:
+            continue
+        for name, value in list(namespace.items()):
+            if value is original:
+                PATCHES.append((module, name, original))
+                setattr(module, name, wrapper)
+
+
+def enable_profiling():
+    global PROFILE_START
+    if PATCHES:
+        return
+
+    reset_profiling()
+    for phase, names in PHASE_FUNCTIONS.items():
+        for name in names:
+            original = getattr(decoder, name)
+            if phase == "execute":
+                wrapper = timed_execute(PHASE_STATS[phase], original)
+            else:
+                wrapper = timed(PHASE_STATS[phase], original)
+            patch_everywhere(original, wrapper)
+    PROFILE_START = time.perf_counter_ns()
+
+
+def disable_profiling():
+    for module, name, original in reversed(PATCHES):
+        setattr(module, name, original)
+    PATCHES.clear()
+
+
+def reset_profiling():
+    global PROFILE_START
+    for stats in PHASE_STATS.values():
+        stats[0] = stats[1] = 0
+    OPERATION_STATS.clear()
+    PROFILE_START = time.perf_counter_ns()
+
+
+def get_profile() -> Dict:
+    return {
+        "wall_time_ns": time.perf_counter_ns() - PROFILE_START,
+        "phases": {
+            phase: {"calls": calls, "time_ns": ns}
+            for phase, (calls, ns) in PHASE_STATS.items()
+        },
+        "operations": {
+            operation.value: {"count": count, "time_ns": ns}
+            for operation, (count, ns) in OPERATION_STATS.items()
+        },
+    }
+
+
+def format_profile_report() -> List[str]:
+    profile = get_profile()
+    wall_time = profile["wall_time_ns"] or 1
+
+    lines = [f"profile: {wall_time / 1e6:.3f} ms wall", ""]
+    lines.append(f"{'phase':<24} {'calls':>10} {'ms':>10} {'ns/call':>10} {'%':>6}")
+    for phase, stats in sorted(
+        profile["phases"].items(), key=lambda item: -item[1]["time_ns"]
+    ):
+        calls, ns = stats["calls"], stats["time_ns"]
+        per_call = ns / calls if calls else 0.0
+        lines.append(
+            f"{phase:<24} {calls:>10} {ns / 1e6:>10.3f} {per_call:>10.0f} "
+            f"{100 * ns / wall_time:>6.1f}"
+        )
+    other = wall_time - sum(stats["time_ns"] for stats in profile["phases"].values())
+    lines.append(
+        f"{'(other)':<24} {'':>10} {other / 1e6:>10.3f} {'':>10} "
+        f"{100 * other / wall_time:>6.1f}"
+    )
+
+    lines.append("")
+    lines.append(f"{'operation':<24} {'count':>10} {'ms':>10} {'ns/instr':>10}")
+    for operation, stats in sorted(
+        profile["operations"].items(), key=lambda item: -item[1]["time_ns"]
+    ):
+        count, ns = stats["count"], stats["time_ns"]
+        lines.append(f"{operation:<24} {count:>10} {ns / 1e6:>10.3f} {ns / count:>10.0f}")
+
+    return lines
+
+
+def write_profile_json(path: str):
+    with open(path, "w") as f:
+        json.dump(get_profile(), f, indent=2)
+        f.write("\n")
@@ -0,0 +1,257 @@
+import struct
+from typing import Optional, Tuple
+
+import simulation
+from decoder import Instruction, decode_at, execute_instruction
+from simulation import (
+    BRANCH_STATS,
+    IP_INDEX,
+    PREV_IP_INDEX,
+    RECORD_FLAG_OP,
+    RECORD_FLAG_RESULT,
+    RECORD_KIND,
+    RECORD_MEM_ADDR,
+    RECORD_MEM_OLD,
+    RECORD_REG,
+    RECORD_REG_OLD,
+    SEG_REG_INDEX_BASE,
+    SIM_FLAGS,
+    SIM_REGISTERS,
+    STEP_BRANCH,
+    STEP_FLAGS,
+    STEP_MEM_WRITE,
+    STEP_RECORD,
+    STEP_REG_WRITE,
+    STEP_TAKEN,
+    invalidate_written_word,
+    pack_flags,
+    read_word,
+    refresh_segment_bases,
+    write_word,
+)
+
+DEFAULT_JOURNAL_CAPACITY = 64 * 1024
+# flag op of a step that started with no pending flags; the flag dst field
+# then holds the packed flag values
+FLAGS_PACKED = 0xFF
+FLAG_NAMES = list(SIM_FLAGS)
+# ip, previous ip, cycles, STEP_* kind, register index, old register value,
+# memory address, old memory word, then the lazy flags before the step as
+# FLAG_OP_* | is_wide << 1 and the 16-bit dst, src and result
+JOURNAL_RECORD = struct.Struct("<HHQBBHIHBHHH")
+# flags state of a journal that has not seen the simulation yet
+UNKNOWN_FLAGS = object()
+
+
+def capture_flags() -> Tuple[int, int, int, int]:
+    pending = simulation.PENDING_FLAGS
+    if pending is None:
+        return (FLAGS_PACKED, pack_flags(), 0, 0)
+    op, dst_val, src_val, result, is_wide = pending
+    return (op | is_wide << 1, dst_val & 0xFFFF, src_val & 0xFFFF, result & 0xFFFF)
+
+
+class Journal:
+    # fixed-capacity ring buffer of packed undo records, one slot per step, so
+    # its size does not depend on the run length
+    def __init__(self, capacity: int = DEFAULT_JOURNAL_CAPACITY):
+        self.capacity = capacity
+        self.records = bytearray(JOURNAL_RECORD.size * capacity)
+        self.head = 0
+        self.count = 0
+        # the flags before the next step, kept from the step records so that
+        # recording never materializes them, and the PENDING_FLAGS they were
+        # taken from; any other PENDING_FLAGS means the flags changed outside
+        # the journal
+        self.flags = capture_flags()
+        self.flags_source = UNKNOWN_FLAGS
+
+    def __len__(self) -> int:
+        return self.count
+
+    def size_in_bytes(self) -> int:
+        return len(self.records)
+
+    def clear(self):
+        # also needed after the simulation state was changed outside the journal
+        self.head = 0
+        self.count = 0
+        self.flags_source = UNKNOWN_FLAGS
+
+    def execute(self, ip: int, instruction: Instruction):
+        # runs the instruction at ip through the record path of the simulator
+        # and keeps what it overwrote
+        if simulation.PENDING_FLAGS is not self.flags_source:
+            self.flags = capture_flags()
+        prev_ip = SIM_REGISTERS[PREV_IP_INDEX]
+        cycles = simulation.SIM_CYCLES
+
+        STEP_RECORD[RECORD_KIND] = 0
+        SIM_REGISTERS[PREV_IP_INDEX] = ip
+        SIM_REGISTERS[IP_INDEX] = ip + instruction.length
+        execute_instruction(instruction, False, True)
+
+        kind = STEP_RECORD[RECORD_KIND]
+        slot = self.head
+        JOURNAL_RECORD.pack_into(
+            self.records,
+            slot * JOURNAL_RECORD.size,
+            ip,
+            prev_ip,
+            cycles,
+            kind,
+            STEP_RECORD[RECORD_REG],
+            STEP_RECORD[RECORD_REG_OLD],
+            STEP_RECORD[RECORD_MEM_ADDR],
+            STEP_RECORD[RECORD_MEM_OLD],
+            *self.flags,
+        )
+        if kind & STEP_FLAGS:
+            self.flags = tuple(STEP_RECORD[RECORD_FLAG_OP : RECORD_FLAG_RESULT + 1])
+        self.flags_source = simulation.PENDING_FLAGS
+
+        self.head = slot + 1 if slot + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def undo(self) -> bool:
+        if not self.count:
+            return False
+
+        slot = (self.head - 1) % self.capacity
+        self.head = slot
+        self.count -= 1
+        (
+            ip,
+            prev_ip,
+            cycles,
+            kind,
+            register,
+            reg_old,
+            address,
+            mem_old,
+            *flags,
+        ) = JOURNAL_RECORD.unpack_from(self.records, slot * JOURNAL_RECORD.size)
+
+        if kind & STEP_REG_WRITE:
+            SIM_REGISTERS[register] = reg_old
+            if register >= SEG_REG_INDEX_BASE:
+                refresh_segment_bases()
+
+        if kind & STEP_MEM_WRITE:
+            if read_word(address) != mem_old:
+                # the step already marked the page dirty; undoing is not a
+                # guest write for watchpoints or the framebuffer
+                write_word(address, mem_old)
+                invalidate_written_word(address)
+
+        if kind & STEP_BRANCH:
+            stats = BRANCH_STATS[ip]
+            stats[0 if kind & STEP_TAKEN else 1] -= 1
+            if not stats[0] and not stats[1]:
+                # the step created the entry
+                del BRANCH_STATS[ip]
+
+        flag_op, flag_dst, flag_src, flag_result = flags
+        if flag_op == FLAGS_PACKED:
+            simulation.PENDING_FLAGS = None
+            for bit, key in enumerate(FLAG_NAMES):
+                SIM_FLAGS[key] = bool(flag_dst & (1 << bit))
+        else:
+            simulation.PENDING_FLAGS = (
+                flag_op & 1,
+                flag_dst,
+                flag_src,
+                flag_result,
+                bool(flag_op & 2),
+            )
+        self.flags = tuple(flags)
+        self.flags_source = simulation.PENDING_FLAGS
+
+        simulation.SIM_CYCLES = cycles
+        SIM_REGISTERS[IP_INDEX] = ip
+        SIM_REGISTERS[PREV_IP_INDEX] = prev_ip
+        return True
+
+
+def step_forward(journal: Journal) -> Instruction:
+    current_ip = SIM_REGISTERS[IP_INDEX]
+    instruction = decode_at(current_ip, use_cache=True)
+    journal.execute(current_ip, instruction)
+    return instruction
+
+
+def run_journaled(
+    journal: Journal, code_length: int, max_instructions: Optional[int] = None
+) -> int:
+    # Journal.execute inlined, with the lookups hoisted out of the loop
+    records = journal.records
+    pack_into = JOURNAL_RECORD.pack_into
+    record_size = JOURNAL_RECORD.size
+    capacity = journal.capacity
+    slot = journal.head
+    count = journal.count
+    flags = journal.flags
+    if simulation.PENDING_FLAGS is not journal.flags_source:
+        flags = capture_flags()
+
+    steps = 0
+    current_ip = SIM_REGISTERS[IP_INDEX]
+    try:
+        while current_ip < code_length:
+            if max_instructions is not None and steps >= max_instructions:
+                break
+            instruction = decode_at(current_ip, True)
+            prev_ip = SIM_REGISTERS[PREV_IP_INDEX]
+            cycles = simulation.SIM_CYCLES
+
+            STEP_RECORD[RECORD_KIND] = 0
+            SIM_REGISTERS[PREV_IP_INDEX] = current_ip
+            SIM_REGISTERS[IP_INDEX] = current_ip + instruction.length
+            execute_instruction(instruction, False, True)
+
+            kind = STEP_RECORD[RECORD_KIND]
+            pack_into(
+                records,
+                slot * record_size,
+                current_ip,
+                prev_ip,
+                cycles,
+                kind,
+                STEP_RECORD[RECORD_REG],
+                STEP_RECORD[RECORD_REG_OLD],
+                STEP_RECORD[RECORD_MEM_ADDR],
+                STEP_RECORD[RECORD_MEM_OLD],
+                *flags,
+            )
+            if kind & STEP_FLAGS:
+                flags = tuple(STEP_RECORD[RECORD_FLAG_OP : RECORD_FLAG_RESULT + 1])
+            slot = slot + 1 if slot + 1 < capacity else 0
+            count += 1
+
+            current_ip = SIM_REGISTERS[IP_INDEX]
+            steps += 1
+    finally:
+        # keep the records of the steps that ran if one of them raised
+        journal.head = slot
+        journal.count = min(count, capacity)
+        journal.flags = flags
+        journal.flags_source = simulation.PENDING_FLAGS
+    return steps
+
+
+def step_back(journal: Journal, count: int = 1) -> int:
+    undone = 0
+    while undone < count and journal.undo():
+        undone += 1
+    return undone
+
+
+def run_back_to_ip(journal: Journal, ip: int) -> int:
+    # undo at least one step, then stop as soon as ip is the next to execute
+    undone = 0
+    while journal.undo():
+        undone += 1
+        if SIM_REGISTERS[IP_INDEX] == ip:
+            break
+    return undone
@@ -0,0 +1,24 @@
+; ========================================================================
+; LISTING 57
+; ========================================================================
+
+; segment registers loaded from and stored to memory; every read after the
+; loads goes through the new segment base
+
+bits 16
+
+mov word [1000], 16
+mov word [1002], 32
+mov word [1004], 48
+mov word [264], 4660
+mov word [776], 22136
+
+mov es, [1002]
+mov ss, [1004]
+mov ds, [1000]
+
+mov ax, [8]
+mov bp, 8
+mov cx, [bp]
+mov [12], es
+mov dx, [12]
@@ -0,0 +1,18 @@
+; ========================================================================
+; LISTING 58
+; ========================================================================
+
+; a word at the top of the 1 MiB address space wraps its high byte around
+; to address 0
+
+bits 16
+
+mov ax, 65535
+mov ds, ax
+mov word [15], 13330
+mov bx, [15]
+mov cx, [14]
+
+mov dx, 0
+mov ds, dx
+mov si, [0]
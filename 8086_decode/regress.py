@@ -0,0 +1,361 @@
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, NamedTuple, Tuple
+
+from decoder import (
+    INSTRUCTION_TYPE_TO_OP,
+    JUMP_TYPES,
+    decode_instruction,
+    format_instruction,
+    get_operation,
+)
+from emulator import run
+from simulation import (
+    RECORD_CYCLES,
+    RECORD_EA_CYCLES,
+    RECORD_KIND,
+    RECORD_REG,
+    RECORD_REG_NEW,
+    RECORD_REG_OLD,
+    REGISTER_NAMES,
+    SIM_FLAGS,
+    STEP_BREAKDOWN,
+    STEP_FLAGS,
+    STEP_REG_WRITE,
+    STEP_SIMULATED,
+    load_code,
+    reset_simulation,
+)
+from tracefile import (
+    STEP_RECORD_OFFSET,
+    compute_flags,
+    format_packed_flags,
+    read_trace,
+    read_trace_header,
+    run_traced,
+)
+from utils import PROBLEMS_DIR, to_signed
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "regress_baseline.json"
+)
+
+STEP_PATTERN = re.compile(r"\b([a-z]{2}):0x([0-9a-f]+)->0x([0-9a-f]+)")
+CLOCKS_PATTERN = re.compile(r"Clocks: \+(\d+) = (\d+)(?: \(([^)]*)\))?")
+STEP_FLAGS_PATTERN = re.compile(r"\bflags:([A-Z]*)->([A-Z]*)")
+# the reference sizes the memory operand, we size the immediate
+SIZE_PATTERN = re.compile(r"\b(?:word|byte) ")
+FINAL_PATTERN = re.compile(r"^\s*([a-z]{2}): 0x([0-9a-f]+)")
+FLAGS_PATTERN = re.compile(r"^\s*flags: ([A-Z]*)")
+
+
+class Expected(NamedTuple):
+    steps: List[str]
+    registers: Dict[str, int]
+    flags: str
+    has_ip: bool
+    has_clocks: bool
+
+
+class Timing(NamedTuple):
+    wall_time: float
+    instructions: int
+    instructions_per_second: float
+    peak_memory: int
+
+
+def find_reference_listings() -> List[Tuple[str, str]]:
+    listings = []
+    for name in sorted(os.listdir(PROBLEMS_DIR)):
+        if name.endswith(".txt"):
+            listings.append(
+                (os.path.join(PROBLEMS_DIR, name[:-4]), os.path.join(PROBLEMS_DIR, name))
+            )
+    return listings
+
+
+def normalize_instruction(text: str) -> str:
+    # "mov word [+1000], 1" and "mov [1000], word 1" both become
+    # "mov [1000], 1"; jumps are "$-7" relative to the jump itself
+    text = SIZE_PATTERN.sub("", text.strip())
+    text = re.sub(r" ([+-]) ", r"\1", text).replace("[+", "[")
+    return re.sub(r"(\$[+-]\d+)\+0$", r"\1", text)
+
+
+def format_clocks(cycles: int, total: int, breakdown: str) -> str:
+    text = f"clocks:+{cycles}={total}"
+    if breakdown:
+        text += f"({breakdown.replace(' ', '')})"
+    return text
+
+
+def format_step(
+    text: str,
+    clocks: str,
+    changes: List[Tuple[str, int, int]],
+    flags: Tuple[str, str],
+) -> str:
+    fields = [normalize_instruction(text)]
+    if clocks:
+        fields.append(clocks)
+    fields.extend(f"{name}:{old:#x}->{new:#x}" for name, old, new in changes)
+    if flags[0] != flags[1]:
+        fields.append(f"flags:{flags[0]}->{flags[1]}")
+    return " ".join(fields)
+
+
+def filter_flags(flags: str) -> str:
+    # the reference tracks every flag; compare only the ones we simulate
+    return "".join(flag for flag in flags if flag in SIM_FLAGS)
+
+
+def parse_reference(path: str) -> Expected:
+    with open(path) as file:
+        lines = file.read().splitlines()
+
+    steps = []
+    registers = {}
+    flags = ""
+    has_ip = False
+    has_clocks = False
+    in_final = False
+    started = False
+    for line in lines:
+        if line.startswith("---") or line.startswith("*"):
+            # only the first (8086) execution section is compared
+            if started:
+                break
+            started = line.startswith("---")
+            continue
+        if not started or not line.strip():
+            continue
+        if line.startswith("Final registers:"):
+            in_final = True
+            continue
+
+        if in_final:
+            match = FLAGS_PATTERN.match(line)
+            if match:
+                flags = filter_flags(match.group(1))
+                continue
+            match = FINAL_PATTERN.match(line)
+            if match:
+                registers[match.group(1)] = int(match.group(2), 16)
+            continue
+
+        text, _, comment = line.partition(" ; ")
+        clocks = ""
+        match = CLOCKS_PATTERN.search(comment)
+        if match:
+            has_clocks = True
+            clocks = format_clocks(int(match.group(1)), int(match.group(2)), match.group(3))
+        changes = [
+            (name, int(old, 16), int(new, 16))
+            for name, old, new in STEP_PATTERN.findall(comment)
+        ]
+        has_ip = has_ip or any(name == "ip" for name, _, _ in changes)
+        step_flags = ("", "")
+        match = STEP_FLAGS_PATTERN.search(comment)
+        if match:
+            step_flags = (filter_flags(match.group(1)), filter_flags(match.group(2)))
+        steps.append(format_step(text, clocks, changes, step_flags))
+
+    return Expected(steps, registers, flags, has_ip, has_clocks)
+
+
+def format_record_instruction(record: Tuple) -> str:
+    ip, _, length, code = record[:4]
+    chunk = code[:length]
+    instruction = decode_instruction(chunk, get_operation(chunk))
+    if instruction.operation in JUMP_TYPES:
+        offset = instruction.immediate + length
+        return f"{INSTRUCTION_TYPE_TO_OP[instruction.operation]} ${offset:+d}"
+
+    text = format_instruction(instruction)
+    if instruction.immediate is not None:
+        # the reference prints immediates unsigned
+        bits = 16 if instruction.wide else 8
+        signed = str(to_signed(instruction.immediate, bits))
+        text = text[: -len(signed)] + str(instruction.immediate & ((1 << bits) - 1))
+    return text
+
+
+def collect_steps(code: bytes, has_ip: bool, has_clocks: bool) -> List[str]:
+    reset_simulation()
+    load_code(code)
+
+    steps = []
+    total_cycles = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.bin")
+        run_traced(len(code), path)
+
+        with open(path, "rb") as file:
+            packed_flags = read_trace_header(file)
+            for record in read_trace(file):
+                ip, next_ip = record[0], record[1]
+                kind = record[STEP_RECORD_OFFSET + RECORD_KIND]
+
+                clocks = ""
+                if has_clocks and kind & STEP_SIMULATED:
+                    cycles = record[STEP_RECORD_OFFSET + RECORD_CYCLES]
+                    total_cycles += cycles
+                    breakdown = ""
+                    if kind & STEP_BREAKDOWN:
+                        ea_cycles = record[STEP_RECORD_OFFSET + RECORD_EA_CYCLES]
+                        breakdown = f"{cycles - ea_cycles} + {ea_cycles}ea"
+                    clocks = format_clocks(cycles, total_cycles, breakdown)
+
+                changes = []
+                if kind & STEP_REG_WRITE:
+                    old = record[STEP_RECORD_OFFSET + RECORD_REG_OLD]
+                    new = record[STEP_RECORD_OFFSET + RECORD_REG_NEW]
+                    if old != new:
+                        name = REGISTER_NAMES[record[STEP_RECORD_OFFSET + RECORD_REG]]
+                        changes.append((name, old, new))
+                if has_ip:
+                    changes.append(("ip", ip, next_ip))
+
+                flags_before = format_packed_flags(packed_flags)
+                if kind & STEP_FLAGS:
+                    packed_flags = compute_flags(record)
+                step_flags = (flags_before, format_packed_flags(packed_flags))
+
+                steps.append(
+                    format_step(
+                        format_record_instruction(record), clocks, changes, step_flags
+                    )
+                )
+
+    return steps
+
+
+def verify_listing(code: bytes, expected: Expected, compiled: bool) -> List[str]:
+    actual = collect_steps(code, expected.has_ip, expected.has_clocks)
+    problems = list(
+        difflib.unified_diff(
+            expected.steps, actual, "expected", "actual", n=1, lineterm=""
+        )
+    )
+
+    result = run(code, compiled=compiled)
+    registers = {
+        name: value
+        for name, value in result.registers.items()
+        if value and (expected.has_ip or name != "ip")
+    }
+    if registers != expected.registers:
+        problems.append(f"registers: expected {expected.registers}, got {registers}")
+
+    flags = "".join(name for name, value in result.flags.items() if value)
+    if flags != expected.flags:
+        problems.append(f"flags: expected {expected.flags!r}, got {flags!r}")
+
+    return problems
+
+
+def time_listing(code: bytes, compiled: bool, min_time: float) -> Timing:
+    # best-of-n keeps scheduler noise out of the short listings
+    wall_time = float("inf")
+    instructions = 0
+    total = 0.0
+    while total < min_time:
+        start = time.perf_counter()
+        instructions = run(code, compiled=compiled).instructions
+        elapsed = time.perf_counter() - start
+        wall_time = min(wall_time, elapsed)
+        total += elapsed
+
+    tracemalloc.start()
+    run(code, compiled=compiled)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rate = instructions / wall_time if wall_time else 0.0
+    return Timing(wall_time, instructions, rate, peak_memory)
+
+
+def compare_timing(
+    name: str, timing: Timing, baseline: Dict[str, float], threshold: float
+) -> List[str]:
+    problems = []
+    if timing.instructions_per_second < baseline["instructions_per_second"] * (
+        1 - threshold
+    ):
+        problems.append(
+            f"{name}: {timing.instructions_per_second:,.0f} instr/s is below "
+            f"baseline {baseline['instructions_per_second']:,.0f}"
+        )
+    if timing.peak_memory > baseline["peak_memory"] * (1 + threshold):
+        problems.append(
+            f"{name}: peak memory {timing.peak_memory} exceeds "
+            f"baseline {baseline['peak_memory']}"
+        )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Regression Suite")
+    parser.add_argument("-b", "--baseline", default=DEFAULT_BASELINE)
+    # writes the timings as the new baseline instead of comparing them
+    parser.add_argument("-u", "--update-baseline", action="store_true")
+    parser.add_argument("-c", "--compile", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.update_baseline:
+        pass
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    else:
+        print(f"no baseline at {args.baseline}, timings are not compared")
+
+    failures = []
+    results = {}
+    for listing, reference in find_reference_listings():
+        name = os.path.basename(listing)
+        with open(listing, "rb") as file:
+            code = file.read()
+
+        problems = verify_listing(code, parse_reference(reference), args.compile)
+        timing = time_listing(code, args.compile, args.min_time)
+        results[name] = timing._asdict()
+
+        if name in baseline:
+            problems.extend(
+                compare_timing(name, timing, baseline[name], args.threshold)
+            )
+
+        status = "FAIL" if problems else "ok"
+        print(
+            f"{status:<4} {name:<40} {timing.wall_time * 1000:9.3f} ms "
+            f"{timing.instructions_per_second:>12,.0f}/s "
+            f"{timing.peak_memory / 1024:8.1f} KiB"
+        )
+        for problem in problems:
+            print(f"\t{problem}")
+        failures.extend(problems)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        print(f"\nwrote baseline to {args.baseline}")
+
+    if failures:
+        print(f"\n{len(failures)} problem(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,107 +1,356 @@
-from typing import Dict, Optional, Tuple
+import mmap
+import struct
+from itertools import compress
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from utils import InstructionType
 
-HALF_REGS = ["al", "bl", "cl", "dl", "ah", "bh", "ch", "dh"]
-PREV_SIM_REGISTERS: Dict[str, int] = {"ip": 0}
-SIM_REGISTERS: Dict[str, int] = {
-    "ip": 0,
+REGISTER_NAMES = ["ax", "cx", "dx", "bx", "sp", "bp", "si", "di", "es", "cs", "ss", "ds", "ip"]
+REGISTER_INDEX = {name: index for index, name in enumerate(REGISTER_NAMES)}
+IP_INDEX = REGISTER_INDEX["ip"]
+CX_INDEX = REGISTER_INDEX["cx"]
+# the previous ip is kept past the named registers for the trace output
+PREV_IP_INDEX = len(REGISTER_NAMES)
+SIM_REGISTERS: List[int] = [0] * (len(REGISTER_NAMES) + 1)
+
+# operand codes 0-15 are the decoder's REG_LOOKUP keys ((reg << 1) | w),
+# followed by the segment registers in SEG_REG_LOOKUP order
+SEG_REG_OPERAND_BASE = 16
+SEG_REG_INDEX_BASE = REGISTER_INDEX["es"]
+
+
+def build_register_alias(code: int) -> Tuple[int, int, int]:
+    if code >= SEG_REG_OPERAND_BASE:
+        return (SEG_REG_INDEX_BASE + code - SEG_REG_OPERAND_BASE, 0, 0xFFFF)
+
+    reg_bits = code >> 1
+    if code & 1:
+        return (reg_bits, 0, 0xFFFF)
+    if reg_bits < 4:
+        return (reg_bits, 0, 0xFF)
+    return (reg_bits - 4, 8, 0xFF)
+
+
+# operand code -> (register index, shift, mask)
+REGISTER_ALIASES = [build_register_alias(code) for code in range(SEG_REG_OPERAND_BASE + 4)]
+# seg << 4 for es, cs, ss, ds, refreshed whenever a segment register is written
+SEGMENT_BASES = [0] * 4
+SS_SEGMENT = REGISTER_INDEX["ss"] - SEG_REG_INDEX_BASE
+DS_SEGMENT = REGISTER_INDEX["ds"] - SEG_REG_INDEX_BASE
+ADDRESS_MASK = 0xFFFFF
+
+# in 8086 FLAGS register order; only valid after materialize_flags()
+SIM_FLAGS: Dict[str, bool] = {
+    "C": False,
+    "P": False,
+    "A": False,
+    "Z": False,
+    "S": False,
+    "O": False,
 }
-SIM_FLAGS: Dict[str, bool] = {"Z": False, "S": False}
-SIM_MEMORY: list[int] = [0] * (1024 * 1024)
+FLAG_OP_ADD = 0
+FLAG_OP_SUB = 1
+# (FLAG_OP_*, dst value, src value, result, is_wide) of the last ALU operation
+# whose flags nobody has read yet
+PENDING_FLAGS: Optional[Tuple[int, int, int, int, bool]] = None
+# branch ip -> [taken, not taken]
+BRANCH_STATS: Dict[int, List[int]] = {}
+PARITY_TABLE = [bin(byte).count("1") % 2 == 0 for byte in range(256)]
+SIM_MEMORY_SIZE = 1024 * 1024
+# anonymous mapping: the OS hands out zeroed pages on first touch, so the
+# untouched bulk of guest memory costs nothing
+DEFAULT_SIM_MEMORY = mmap.mmap(-1, SIM_MEMORY_SIZE)
+# any writable buffer (bytearray, mmap) can back guest memory, see use_memory
+SIM_MEMORY: Any = DEFAULT_SIM_MEMORY
+SIM_MEMORY_VIEW = memoryview(SIM_MEMORY)
+WORD = struct.Struct("<H")
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT
+# one byte per page of guest memory, set by every write since the last reset
+DIRTY_PAGES = bytearray(SIM_MEMORY_SIZE >> PAGE_SHIFT)
+# pages holding a watchpoint; accesses there call every listener with
+# (loc, value, is_write), see debug.py
+WATCH_PAGES = bytearray(SIM_MEMORY_SIZE >> PAGE_SHIFT)
+MEMORY_WATCH_LISTENERS: List[Callable[[int, int, bool], None]] = []
 SIM_CYCLES: int = 0
+# [low, high) range of guest memory shown as a framebuffer, see framebuffer.py
+FRAMEBUFFER_RANGE = [0, 0]
+FRAMEBUFFER_WRITES: int = 0
+
+# filled in by update_simulation(trace=False, record=True) for the binary trace
+# and the reverse-execution journal
+STEP_SIMULATED = 1
+STEP_REG_WRITE = 2
+STEP_MEM_WRITE = 4
+STEP_FLAGS = 8
+STEP_BREAKDOWN = 16
+# set by execute_branch, with STEP_TAKEN when the branch was taken
+STEP_BRANCH = 32
+STEP_TAKEN = 64
+RECORD_KIND = 0
+RECORD_REG = 1
+RECORD_REG_OLD = 2
+RECORD_REG_NEW = 3
+# the inputs of the pending flags, FLAG_OP_* | is_wide << 1 and the 16-bit
+# dst, src and result; flags are only computed when a trace is rendered
+RECORD_FLAG_OP = 4
+RECORD_FLAG_DST = 5
+RECORD_FLAG_SRC = 6
+RECORD_FLAG_RESULT = 7
+RECORD_MEM_ADDR = 8
+RECORD_MEM_VALUE = 9
+RECORD_MEM_OLD = 10
+RECORD_CYCLES = 11
+RECORD_EA_CYCLES = 12
+STEP_RECORD: List[int] = [0] * 13
+
+MAX_INSTRUCTION_LENGTH = 6
+# ip -> (decoded instruction, length)
+DECODE_CACHE: Dict[int, Tuple[Any, int]] = {}
+# [low, high) address range covered by cached instructions
+DECODE_CACHE_RANGE = [0, 0]
+DECODE_CACHE_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+# called with (loc, size) whenever a write lands on cached code
+CODE_WRITE_LISTENERS: List[Callable[[int, int], None]] = []
+
+
+def is_wide_reg(code: int) -> bool:
+    return REGISTER_ALIASES[code][2] == 0xFFFF
+
+
+def get_reg(code: int) -> int:
+    index, shift, mask = REGISTER_ALIASES[code]
+    return (SIM_REGISTERS[index] >> shift) & mask
+
+
+def set_reg(code: int, new_val: int):
+    index, shift, mask = REGISTER_ALIASES[code]
+    prev = SIM_REGISTERS[index]
+    SIM_REGISTERS[index] = (prev & (0xFFFF ^ (mask << shift))) | ((new_val & mask) << shift)
+    if index >= SEG_REG_INDEX_BASE:
+        SEGMENT_BASES[index - SEG_REG_INDEX_BASE] = SIM_REGISTERS[index] << 4
+
+
+def refresh_segment_bases():
+    # after SIM_REGISTERS was written wholesale
+    for segment in range(len(SEGMENT_BASES)):
+        SEGMENT_BASES[segment] = SIM_REGISTERS[SEG_REG_INDEX_BASE + segment] << 4
+
+
+def update_reg(code: int, new_val: int) -> str:
+    index = REGISTER_ALIASES[code][0]
+    prev = SIM_REGISTERS[index]
+    set_reg(code, new_val)
+
+    return f" ; {REGISTER_NAMES[index]}:0x{prev:04x}->0x{SIM_REGISTERS[index]:04x}"
 
 
-def get_half_reg(src: str) -> int:
-    full_reg = f"{src[0]}x"
+def get_ip_register() -> tuple[int, int]:
+    return (SIM_REGISTERS[IP_INDEX], SIM_REGISTERS[PREV_IP_INDEX])
 
-    if full_reg not in SIM_REGISTERS:
-        SIM_REGISTERS[full_reg] = 0
 
-    val = SIM_REGISTERS[full_reg]
+def set_ip_register(new_val: int) -> tuple[int, int]:
+    SIM_REGISTERS[PREV_IP_INDEX] = SIM_REGISTERS[IP_INDEX]
+    SIM_REGISTERS[IP_INDEX] = new_val
+    return (new_val, SIM_REGISTERS[PREV_IP_INDEX])
 
-    if src[-1] == "l":
-        return val & 0xFF
 
-    return val >> 8
+def read_word(loc: int) -> int:
+    # raw access, not seen by watchpoints; the high byte of a word at the top
+    # of the address space wraps around to 0 as on the 8086
+    if loc == ADDRESS_MASK:
+        return SIM_MEMORY[loc] | SIM_MEMORY[0] << 8
+    return WORD.unpack_from(SIM_MEMORY, loc)[0]
 
 
-def update_half_reg(dst: str, new_val: int):
-    full_reg = f"{dst[0]}x"
+def write_word(loc: int, value: int):
+    if loc == ADDRESS_MASK:
+        SIM_MEMORY[loc] = value & 0xFF
+        SIM_MEMORY[0] = (value >> 8) & 0xFF
+    else:
+        WORD.pack_into(SIM_MEMORY, loc, value & 0xFFFF)
 
-    if full_reg not in SIM_REGISTERS:
-        SIM_REGISTERS[full_reg] = 0
 
-    if full_reg not in PREV_SIM_REGISTERS:
-        PREV_SIM_REGISTERS[full_reg] = 0
+def invalidate_written_word(loc: int):
+    if loc + 2 > DECODE_CACHE_RANGE[0] and loc < DECODE_CACHE_RANGE[1]:
+        invalidate_decoded(loc, 2)
+    if loc == ADDRESS_MASK and DECODE_CACHE_RANGE[0] == 0 < DECODE_CACHE_RANGE[1]:
+        invalidate_decoded(0, 1)
 
-    prev = SIM_REGISTERS[full_reg]
-    PREV_SIM_REGISTERS[full_reg] = prev
 
-    if dst[-1] == "l":
-        SIM_REGISTERS[full_reg] = (prev & 0xFF00) | (new_val & 0xFF)
+def get_memory(loc: int) -> int:
+    if loc == ADDRESS_MASK:
+        value = read_word(loc)
     else:
-        SIM_REGISTERS[full_reg] = (prev & 0x00FF) | ((new_val & 0xFF) << 8)
+        value = WORD.unpack_from(SIM_MEMORY, loc)[0]
+    if WATCH_PAGES[loc >> PAGE_SHIFT]:
+        for listener in MEMORY_WATCH_LISTENERS:
+            listener(loc, value, False)
+    return value
 
-    return f" ; {full_reg}:0x{prev:04x}->0x{SIM_REGISTERS[full_reg]:04x}"
 
+def set_memory(loc: int, new_val: int):
+    global FRAMEBUFFER_WRITES
+    if loc == ADDRESS_MASK:
+        write_word(loc, new_val)
+    else:
+        WORD.pack_into(SIM_MEMORY, loc, new_val & 0xFFFF)
+    DIRTY_PAGES[loc >> PAGE_SHIFT] = 1
+    DIRTY_PAGES[((loc + 1) & ADDRESS_MASK) >> PAGE_SHIFT] = 1
 
-def get_full_reg(dst: str):
-    if dst not in SIM_REGISTERS:
-        SIM_REGISTERS[dst] = 0
+    if loc + 2 > FRAMEBUFFER_RANGE[0] and loc < FRAMEBUFFER_RANGE[1]:
+        FRAMEBUFFER_WRITES += 1
 
-    return SIM_REGISTERS[dst]
+    if WATCH_PAGES[loc >> PAGE_SHIFT]:
+        for listener in MEMORY_WATCH_LISTENERS:
+            listener(loc, new_val & 0xFFFF, True)
 
+    invalidate_written_word(loc)
 
-def update_full_reg(dst: str, new_val: int):
-    if dst not in SIM_REGISTERS:
-        SIM_REGISTERS[dst] = 0
 
-    if dst not in PREV_SIM_REGISTERS:
-        PREV_SIM_REGISTERS[dst] = 0
+def use_memory(buffer: Optional[Any] = None):
+    global SIM_MEMORY, SIM_MEMORY_VIEW, SIM_MEMORY_SIZE
+    if SIM_MEMORY is not DEFAULT_SIM_MEMORY:
+        # an mmap cannot be closed while a view of it is alive
+        SIM_MEMORY_VIEW.release()
 
-    prev = SIM_REGISTERS[dst]
-    PREV_SIM_REGISTERS[dst] = prev
-    SIM_REGISTERS[dst] = new_val & 0xFFFF
+    if buffer is None:
+        buffer = DEFAULT_SIM_MEMORY
 
-    return f" ; {dst}:0x{prev:04x}->0x{SIM_REGISTERS[dst]:04x}"
+    SIM_MEMORY = buffer
+    SIM_MEMORY_VIEW = memoryview(buffer)
+    SIM_MEMORY_SIZE = len(buffer)
+    # nothing is known about the contents of the new buffer; the bitmap keeps
+    # one byte per page of the 1 MiB address space whatever the buffer size
+    page_count = min((SIM_MEMORY_SIZE + PAGE_SIZE - 1) >> PAGE_SHIFT, len(DIRTY_PAGES))
+    DIRTY_PAGES[:page_count] = b"\x01" * page_count
+    DIRTY_PAGES[page_count:] = bytes(len(DIRTY_PAGES) - page_count)
+    clear_decode_cache()
 
 
-def get_ip_register() -> tuple[int, int]:
-    return (SIM_REGISTERS["ip"], PREV_SIM_REGISTERS["ip"])
+def get_memory_view() -> memoryview:
+    return SIM_MEMORY_VIEW
 
 
-def set_ip_register(new_val: int) -> tuple[int, int]:
-    PREV_SIM_REGISTERS["ip"] = SIM_REGISTERS["ip"]
-    SIM_REGISTERS["ip"] = new_val
-    return (SIM_REGISTERS["ip"], PREV_SIM_REGISTERS["ip"])
+def load_code(code: bytes):
+    if len(code) > SIM_MEMORY_SIZE:
+        raise Exception(f"code size {len(code)} exceeds memory size")
+    SIM_MEMORY_VIEW[: len(code)] = code
+    mark_dirty(0, len(code))
 
+    clear_decode_cache()
 
-def get_memory(loc: int) -> int:
-    low = SIM_MEMORY[loc]
-    high = SIM_MEMORY[loc + 1]
-    return (high << 8) | low
 
+def mark_dirty(loc: int, size: int):
+    for page in range(loc >> PAGE_SHIFT, ((loc + size - 1) >> PAGE_SHIFT) + 1):
+        DIRTY_PAGES[page] = 1
 
-def set_memory(loc: int, new_val: int):
-    SIM_MEMORY[loc] = new_val & 0xFF
-    SIM_MEMORY[loc + 1] = (new_val >> 8) & 0xFF
 
+def get_dirty_pages() -> List[int]:
+    return list(compress(range(len(DIRTY_PAGES)), DIRTY_PAGES))
 
-def load_code(code: bytes):
-    for i, byte in enumerate(code):
-        SIM_MEMORY[i] = byte
+
+def get_page_view(page: int) -> memoryview:
+    return SIM_MEMORY_VIEW[page << PAGE_SHIFT : (page + 1) << PAGE_SHIFT]
+
+
+def clear_memory():
+    # only written pages can be non-zero
+    zero_page = bytes(PAGE_SIZE)
+    for page in get_dirty_pages():
+        page_view = get_page_view(page)
+        page_view[:] = zero_page[: len(page_view)]
+        DIRTY_PAGES[page] = 0
+
+
+def snapshot_memory() -> Dict[int, bytes]:
+    return {page: get_page_view(page).tobytes() for page in get_dirty_pages()}
+
+
+def restore_memory(snapshot: Dict[int, bytes]):
+    zero_page = bytes(PAGE_SIZE)
+    for page in get_dirty_pages():
+        if page not in snapshot:
+            page_view = get_page_view(page)
+            page_view[:] = zero_page[: len(page_view)]
+            DIRTY_PAGES[page] = 0
+    for page, data in snapshot.items():
+        get_page_view(page)[:] = data
+        DIRTY_PAGES[page] = 1
+
+    clear_decode_cache()
+
+
+def reset_simulation():
+    global SIM_CYCLES
+    SIM_REGISTERS[:] = [0] * len(SIM_REGISTERS)
+    refresh_segment_bases()
+    global PENDING_FLAGS
+    for key in SIM_FLAGS:
+        SIM_FLAGS[key] = False
+    PENDING_FLAGS = None
+    BRANCH_STATS.clear()
+    clear_memory()
+    SIM_CYCLES = 0
+    clear_decode_cache()
+
+
+def get_cached_instruction(ip: int) -> Optional[Any]:
+    entry = DECODE_CACHE.get(ip)
+    if entry is None:
+        DECODE_CACHE_STATS["misses"] += 1
+        return None
+
+    DECODE_CACHE_STATS["hits"] += 1
+    return entry[0]
+
+
+def cache_instruction(ip: int, instruction: Any, length: int):
+    DECODE_CACHE[ip] = (instruction, length)
+
+    if DECODE_CACHE_RANGE[0] == DECODE_CACHE_RANGE[1]:
+        DECODE_CACHE_RANGE[0] = ip
+        DECODE_CACHE_RANGE[1] = ip + length
+    else:
+        DECODE_CACHE_RANGE[0] = min(DECODE_CACHE_RANGE[0], ip)
+        DECODE_CACHE_RANGE[1] = max(DECODE_CACHE_RANGE[1], ip + length)
+
+
+def invalidate_decoded(loc: int, size: int):
+    invalidated = False
+    for ip in range(loc - MAX_INSTRUCTION_LENGTH + 1, loc + size):
+        entry = DECODE_CACHE.get(ip)
+        if entry is not None and ip + entry[1] > loc:
+            del DECODE_CACHE[ip]
+            DECODE_CACHE_STATS["invalidations"] += 1
+            invalidated = True
+
+    if invalidated:
+        for listener in CODE_WRITE_LISTENERS:
+            listener(loc, size)
+
+
+def clear_decode_cache():
+    DECODE_CACHE.clear()
+    for listener in CODE_WRITE_LISTENERS:
+        listener(0, SIM_MEMORY_SIZE)
+    DECODE_CACHE_RANGE[0] = 0
+    DECODE_CACHE_RANGE[1] = 0
+    for key in DECODE_CACHE_STATS:
+        DECODE_CACHE_STATS[key] = 0
 
 
 def get_code_byte(address: int) -> int:
-    if address >= len(SIM_MEMORY):
+    if address >= SIM_MEMORY_SIZE:
         raise Exception(f"Address {address} exceeds memory size")
     return SIM_MEMORY[address]
 
 
 def grab_chunk_from_memory(working_ip: int, amount: int) -> tuple[bytes, int]:
-    chunk = bytes(get_code_byte(working_ip + i) for i in range(amount))
-    return chunk, working_ip + amount
+    end = working_ip + amount
+    if end > SIM_MEMORY_SIZE:
+        raise Exception(f"Address {end - 1} exceeds memory size")
+    return SIM_MEMORY_VIEW[working_ip:end].tobytes(), end
 
 
 R_M_BASE_REGS = {
@@ -116,40 +365,112 @@ R_M_BASE_REGS = {
 }
 
 
+R_M_BASE_INDICES = {
+    r_m: (REGISTER_INDEX[base_reg], REGISTER_INDEX[index_reg] if index_reg else None)
+    for r_m, (base_reg, index_reg) in R_M_BASE_REGS.items()
+}
+
+# default segment of each r_m: SS when addressing through bp, DS otherwise
+R_M_SEGMENTS = {
+    r_m: SS_SEGMENT if "bp" in regs else DS_SEGMENT for r_m, regs in R_M_BASE_REGS.items()
+}
+
+
 def calc_effective_address(r_m: int, displacement: int) -> int:
-    base_reg, index_reg = R_M_BASE_REGS[r_m]
-    addr = get_full_reg(base_reg) + displacement
-    if index_reg:
-        addr += get_full_reg(index_reg)
+    base_index, index_index = R_M_BASE_INDICES[r_m]
+    addr = SIM_REGISTERS[base_index] + displacement
+    if index_index is not None:
+        addr += SIM_REGISTERS[index_index]
     return addr & 0xFFFF
 
 
+REGISTER_DISPLAY_ORDER = [
+    REGISTER_INDEX[name]
+    for name in ("ax", "bx", "cx", "dx", "sp", "bp", "si", "di", "es", "cs", "ss", "ds", "ip")
+]
+
+
+def format_registers() -> List[str]:
+    result = []
+    for index in REGISTER_DISPLAY_ORDER:
+        val = SIM_REGISTERS[index]
+        if val:
+            result.append(f"{REGISTER_NAMES[index]}: {val:#06x} ({val})")
+    return result
+
+
+def get_cycles() -> int:
+    return SIM_CYCLES
+
+
 def format_ip() -> str:
     current_ip, prev_ip = get_ip_register()
     return f" ip:{prev_ip:#04x}->{current_ip:#04x}"
 
 
 def format_flags() -> str:
+    flags = get_flags()
     result = ""
-    for key in SIM_FLAGS:
-        if SIM_FLAGS[key]:
+    for key in flags:
+        if flags[key]:
             result += key
 
     return result
 
 
-def update_flags(result: int, is_wide: bool) -> str:
-    before_flags = format_flags()
+def set_flags(op: int, dst_val: int, src_val: int, result: int, is_wide: bool):
+    global PENDING_FLAGS
+    PENDING_FLAGS = (op, dst_val, src_val, result, is_wide)
+
 
-    if is_wide:
-        masked_result = result & 0xFFFF
-        SIM_FLAGS["S"] = (masked_result & 0x8000) != 0
-        SIM_FLAGS["Z"] = masked_result == 0
+def materialize_flags():
+    global PENDING_FLAGS
+    if PENDING_FLAGS is None:
+        return
+
+    op, dst_val, src_val, result, is_wide = PENDING_FLAGS
+    PENDING_FLAGS = None
+
+    mask, sign = (0xFFFF, 0x8000) if is_wide else (0xFF, 0x80)
+    dst_val &= mask
+    src_val &= mask
+    masked_result = result & mask
+
+    if op == FLAG_OP_ADD:
+        SIM_FLAGS["C"] = dst_val + src_val > mask
+        SIM_FLAGS["A"] = (dst_val & 0xF) + (src_val & 0xF) > 0xF
+        overflow = (dst_val ^ masked_result) & (src_val ^ masked_result)
     else:
-        masked_result = result & 0xFF
-        SIM_FLAGS["S"] = (masked_result & 0x80) != 0
-        SIM_FLAGS["Z"] = masked_result == 0
+        SIM_FLAGS["C"] = dst_val < src_val
+        SIM_FLAGS["A"] = (dst_val & 0xF) < (src_val & 0xF)
+        overflow = (dst_val ^ src_val) & (dst_val ^ masked_result)
+
+    SIM_FLAGS["P"] = PARITY_TABLE[masked_result & 0xFF]
+    SIM_FLAGS["Z"] = masked_result == 0
+    SIM_FLAGS["S"] = (masked_result & sign) != 0
+    SIM_FLAGS["O"] = (overflow & sign) != 0
+
 
+def get_flags() -> Dict[str, bool]:
+    if PENDING_FLAGS is not None:
+        materialize_flags()
+    return SIM_FLAGS
+
+
+def pack_flags() -> int:
+    flags = get_flags()
+    packed = 0
+    for bit, key in enumerate(flags):
+        if flags[key]:
+            packed |= 1 << bit
+    return packed
+
+
+def update_flags(
+    op: int, dst_val: int, src_val: int, result: int, is_wide: bool
+) -> str:
+    before_flags = format_flags()
+    set_flags(op, dst_val, src_val, result, is_wide)
     after_flags = format_flags()
 
     if before_flags != after_flags:
@@ -159,33 +480,39 @@ def update_flags(result: int, is_wide: bool) -> str:
 
 
 def update_simulation(
-    dst: str,
+    dst: Optional[int],
     operation: InstructionType,
-    src: Optional[str] = None,
+    src: Optional[int] = None,
     immediate: Optional[int] = None,
     src_addr: Optional[int] = None,
     dst_addr: Optional[int] = None,
     mod: Optional[int] = None,
     r_m: Optional[int] = None,
     displacement: int = 0,
+    trace: bool = True,
+    record: bool = False,
 ) -> str:
     global SIM_CYCLES
-    if src is None and immediate is None:
+    if src is None and src_addr is None and immediate is None:
         raise Exception("src or immediate must be provided")
 
-    is_mem_src = src_addr is not None
     is_mem_dst = dst_addr is not None
 
     cycles, breakdown = estimate_clocks(operation, mod, r_m, is_mem_dst, displacement)
     SIM_CYCLES += cycles
-    comment = f" ; Clocks: +{cycles} = {SIM_CYCLES}"
-    if "+" in breakdown:
-        comment += f" ({breakdown})"
+    if trace:
+        comment = f" ; Clocks: +{cycles} = {SIM_CYCLES}"
+        if "+" in breakdown:
+            comment += f" ({breakdown})"
+    else:
+        comment = ""
 
-    if is_mem_dst:
-        dst_val = get_memory(dst_addr)
+    if src is not None:
+        src_val = get_reg(src)
+    elif src_addr is not None:
+        src_val = get_memory(src_addr)
     else:
-        dst_val = get_half_reg(dst) if dst in HALF_REGS else get_full_reg(dst)
+        src_val = immediate
 
     is_mov = operation in (
         InstructionType.MOV,
@@ -213,118 +540,74 @@ def update_simulation(
         InstructionType.SUB_IMM_MEM,
     )
 
-    if src:
-        if is_mem_src:
-            src_val = get_memory(src_addr)
-        else:
-            src_val = get_half_reg(src) if src in HALF_REGS else get_full_reg(src)
-
-        if is_mov:
-            new_val = src_val
-
-            if is_mem_dst:
-                set_memory(dst_addr, new_val)
-                return comment + " |" + format_ip()
-            else:
-                return (
-                    update_half_reg(dst, new_val)
-                    if dst in HALF_REGS
-                    else update_full_reg(dst, new_val)
-                ) + comment + " |" + format_ip()
-
-        if is_cmp:
-            new_val = dst_val - src_val
-            return comment + f" |{format_ip()}{update_flags(new_val, is_mem_dst or dst not in HALF_REGS)}"
-
+    if is_mov:
+        new_val = src_val
+    else:
+        dst_val = get_memory(dst_addr) if is_mem_dst else get_reg(dst)
+        flag_op = FLAG_OP_ADD if is_add else FLAG_OP_SUB
         if is_add:
             new_val = dst_val + src_val
-
-            if is_mem_dst:
-                set_memory(dst_addr, new_val)
-                return comment + " |" + format_ip() + update_flags(new_val, True)
-            else:
-                return (
-                    (
-                        update_half_reg(dst, new_val)
-                        if dst in HALF_REGS
-                        else update_full_reg(dst, new_val)
-                    )
-                    + comment
-                    + " |" + format_ip()
-                    + update_flags(new_val, dst not in HALF_REGS)
-                )
-
-        if is_sub:
+        elif is_sub or is_cmp:
             new_val = dst_val - src_val
+        else:
+            return comment
+
+    if record:
+        kind = STEP_SIMULATED
+        STEP_RECORD[RECORD_CYCLES] = cycles
+        STEP_RECORD[RECORD_EA_CYCLES] = 0
+        if "+" in breakdown:
+            kind |= STEP_BREAKDOWN
+            STEP_RECORD[RECORD_EA_CYCLES] = calc_ea_cycles(mod, r_m, displacement)
+        if not is_cmp:
             if is_mem_dst:
-                set_memory(dst_addr, new_val)
-                return comment + " |" + format_ip() + update_flags(new_val, True)
+                kind |= STEP_MEM_WRITE
+                STEP_RECORD[RECORD_MEM_ADDR] = dst_addr
+                STEP_RECORD[RECORD_MEM_VALUE] = new_val & 0xFFFF
+                # raw read: recording is not a guest access for watchpoints
+                STEP_RECORD[RECORD_MEM_OLD] = read_word(dst_addr)
             else:
-                return (
-                    (
-                        update_half_reg(dst, new_val)
-                        if dst in HALF_REGS
-                        else update_full_reg(dst, new_val)
-                    )
-                    + comment
-                    + " |" + format_ip()
-                    + update_flags(new_val, dst not in HALF_REGS)
-                )
-
-        return comment
-
-    if immediate is not None:
-        if is_mov:
-            new_val = immediate
+                kind |= STEP_REG_WRITE
+                index = REGISTER_ALIASES[dst][0]
+                STEP_RECORD[RECORD_REG] = index
+                STEP_RECORD[RECORD_REG_OLD] = SIM_REGISTERS[index]
+        if not is_mov:
+            kind |= STEP_FLAGS
+        STEP_RECORD[RECORD_KIND] = kind
+
+    if not trace:
+        if not is_cmp:
             if is_mem_dst:
                 set_memory(dst_addr, new_val)
-                return comment + " |" + format_ip()
             else:
-                return (
-                    update_half_reg(dst, new_val)
-                    if dst in HALF_REGS
-                    else update_full_reg(dst, new_val)
-                ) + comment + " |" + format_ip()
-
-        if is_cmp:
-            new_val = dst_val - immediate
-            return comment + f" |{format_ip()}{update_flags(new_val, is_mem_dst or dst not in HALF_REGS)}"
+                set_reg(dst, new_val)
+        if not is_mov:
+            is_wide = is_mem_dst or is_wide_reg(dst)
+            set_flags(flag_op, dst_val, src_val, new_val, is_wide)
+
+        if record:
+            if not is_cmp and not is_mem_dst:
+                STEP_RECORD[RECORD_REG_NEW] = SIM_REGISTERS[STEP_RECORD[RECORD_REG]]
+            if not is_mov:
+                STEP_RECORD[RECORD_FLAG_OP] = flag_op | (is_wide << 1)
+                STEP_RECORD[RECORD_FLAG_DST] = dst_val & 0xFFFF
+                STEP_RECORD[RECORD_FLAG_SRC] = src_val & 0xFFFF
+                STEP_RECORD[RECORD_FLAG_RESULT] = new_val & 0xFFFF
+        return ""
+
+    reg_trace = ""
+    if not is_cmp:
+        if is_mem_dst:
+            set_memory(dst_addr, new_val)
+        else:
+            reg_trace = update_reg(dst, new_val)
 
-        if is_add:
-            new_val = dst_val + immediate
-            if is_mem_dst:
-                set_memory(dst_addr, new_val)
-                return comment + " |" + format_ip() + update_flags(new_val, True)
-            else:
-                return (
-                    (
-                        update_half_reg(dst, new_val)
-                        if dst in HALF_REGS
-                        else update_full_reg(dst, new_val)
-                    )
-                    + comment
-                    + " |" + format_ip()
-                    + update_flags(new_val, dst not in HALF_REGS)
-                )
-
-        if is_sub:
-            new_val = dst_val - immediate
-            if is_mem_dst:
-                set_memory(dst_addr, new_val)
-                return comment + " |" + format_ip() + update_flags(new_val, True)
-            else:
-                return (
-                    (
-                        update_half_reg(dst, new_val)
-                        if dst in HALF_REGS
-                        else update_full_reg(dst, new_val)
-                    )
-                    + comment
-                    + " |" + format_ip()
-                    + update_flags(new_val, dst not in HALF_REGS)
-                )
-
-    return comment
+    result = reg_trace + comment + " |" + format_ip()
+    if not is_mov:
+        result += update_flags(
+            flag_op, dst_val, src_val, new_val, is_mem_dst or is_wide_reg(dst)
+        )
+    return result
 
 
 def calc_ea_cycles(mod: int, r_m: int, displacement: int = 0) -> int:
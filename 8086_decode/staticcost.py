@@ -0,0 +1,235 @@
+import argparse
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cfg import BasicBlock, ControlFlowGraph, build_cfg
+from decoder import BRANCH_TABLE, JUMP_TYPES, Instruction, format_instruction
+from simulation import calc_ea_cycles, estimate_clocks, load_code, reset_simulation
+from utils import InstructionType
+
+
+class BlockCost(NamedTuple):
+    start: int
+    instructions: int
+    # straight-line cycles before the terminating branch
+    cycles: int
+    ea_cycles: int
+    # cycles including the branch; both equal `cycles` without a branch
+    taken_cycles: int
+    not_taken_cycles: int
+
+
+class LoopCost(NamedTuple):
+    header: int
+    latch: int
+    end: int
+    trips: Optional[int]
+    # one iteration that branches back to the header
+    iteration_best: int
+    iteration_worst: int
+    # every iteration, the last one falling out of the loop
+    total_best: Optional[int]
+    total_worst: Optional[int]
+
+
+def estimate_instruction(instruction: Instruction) -> Tuple[int, int]:
+    operation = instruction.operation
+    modrm = instruction.modrm
+    mod = modrm.mod if modrm is not None and operation != InstructionType.MOV_IMM else None
+    r_m = modrm.r_m if mod is not None else None
+    is_mem_dst = instruction.dst is None
+    cycles, breakdown = estimate_clocks(
+        operation, mod, r_m, is_mem_dst, instruction.displacement
+    )
+
+    ea_cycles = 0
+    if "ea" in breakdown:
+        ea_cycles = calc_ea_cycles(mod, r_m, instruction.displacement)
+    return cycles, ea_cycles
+
+
+def estimate_block(block: BasicBlock) -> BlockCost:
+    cycles = 0
+    ea_cycles = 0
+    taken = not_taken = 0
+    for _, instruction in block.instructions:
+        if instruction.operation in JUMP_TYPES:
+            branch = BRANCH_TABLE[instruction.operation]
+            taken = branch.taken_cycles
+            not_taken = branch.not_taken_cycles
+            continue
+        instruction_cycles, instruction_ea = estimate_instruction(instruction)
+        cycles += instruction_cycles
+        ea_cycles += instruction_ea
+
+    return BlockCost(
+        block.start,
+        len(block.instructions),
+        cycles,
+        ea_cycles,
+        cycles + taken,
+        cycles + not_taken,
+    )
+
+
+def find_loops(cfg: ControlFlowGraph) -> List[Tuple[int, int, int]]:
+    # (header, latch, end) for every back edge, innermost (shortest) first
+    loops = []
+    for block in cfg.blocks.values():
+        last_ip, last = block.instructions[-1]
+        if last.operation not in JUMP_TYPES:
+            continue
+        target = block.successors[0]
+        if target in cfg.blocks and target <= block.start:
+            loops.append((target, block.start, block.end))
+    return sorted(loops, key=lambda loop: loop[2] - loop[0])
+
+
+def estimate_loops(
+    cfg: ControlFlowGraph, costs: Dict[int, BlockCost], trips: Dict[int, int]
+) -> List[LoopCost]:
+    loops: List[LoopCost] = []
+    for header, latch, end in find_loops(cfg):
+        best = worst = 0
+        exit_best = exit_worst = 0
+        start = header
+        while start < end:
+            # an inner loop already estimated stands in for its blocks
+            inner = next(
+                (
+                    loop
+                    for loop in loops
+                    if loop.header == start and loop.end <= end and loop.header != header
+                ),
+                None,
+            )
+            if inner is not None:
+                if inner.total_best is None:
+                    inner_best, inner_worst = inner.iteration_best, inner.iteration_worst
+                else:
+                    inner_best, inner_worst = inner.total_best, inner.total_worst
+                best += inner_best
+                worst += inner_worst
+                start = inner.end
+                continue
+
+            block = cfg.blocks.get(start)
+            if block is None:
+                break
+            cost = costs[start]
+            if start == latch:
+                exit_best = best + cost.not_taken_cycles
+                exit_worst = worst + cost.not_taken_cycles
+                best += cost.taken_cycles
+                worst += cost.taken_cycles
+            else:
+                best += min(cost.taken_cycles, cost.not_taken_cycles)
+                worst += max(cost.taken_cycles, cost.not_taken_cycles)
+            start = block.end
+
+        count = trips.get(header)
+        total_best = total_worst = None
+        if count is not None:
+            total_best = (count - 1) * best + exit_best
+            total_worst = (count - 1) * worst + exit_worst
+        loops.append(
+            LoopCost(header, latch, end, count, best, worst, total_best, total_worst)
+        )
+    return loops
+
+
+def estimate_total(
+    cfg: ControlFlowGraph, costs: Dict[int, BlockCost], loops: List[LoopCost]
+) -> Optional[Tuple[int, int]]:
+    # straight-line walk over the top level, loops counted by their hints
+    best = worst = 0
+    start = cfg.entry
+    while start < cfg.code_length:
+        outer = [loop for loop in loops if loop.header == start]
+        if outer:
+            loop = max(outer, key=lambda loop: loop.end - loop.header)
+            if loop.total_best is None:
+                return None
+            best += loop.total_best
+            worst += loop.total_worst
+            start = loop.end
+            continue
+
+        block = cfg.blocks.get(start)
+        if block is None:
+            break
+        cost = costs[start]
+        best += min(cost.taken_cycles, cost.not_taken_cycles)
+        worst += max(cost.taken_cycles, cost.not_taken_cycles)
+        start = block.end
+    return best, worst
+
+
+def format_cost_table(
+    cfg: ControlFlowGraph, costs: Dict[int, BlockCost], loops: List[LoopCost]
+) -> List[str]:
+    lines = [
+        f"{'block':<8} {'instr':>6} {'cycles':>8} {'ea':>6} {'taken':>8} "
+        f"{'fallthru':>8}  last instruction"
+    ]
+    for start in sorted(costs):
+        cost = costs[start]
+        _, last = cfg.blocks[start].instructions[-1]
+        lines.append(
+            f"{start:#06x}   {cost.instructions:>6} {cost.cycles:>8} {cost.ea_cycles:>6} "
+            f"{cost.taken_cycles:>8} {cost.not_taken_cycles:>8}  {format_instruction(last)}"
+        )
+
+    if loops:
+        lines.append("")
+        lines.append(
+            f"{'loop':<16} {'trips':>6} {'iter best':>10} {'iter worst':>10} "
+            f"{'total best':>12} {'total worst':>12}"
+        )
+    for loop in loops:
+        trips = "?" if loop.trips is None else str(loop.trips)
+        total_best = "?" if loop.total_best is None else str(loop.total_best)
+        total_worst = "?" if loop.total_worst is None else str(loop.total_worst)
+        lines.append(
+            f"{loop.header:#06x}-{loop.end:#06x}    {trips:>6} {loop.iteration_best:>10} "
+            f"{loop.iteration_worst:>10} {total_best:>12} {total_worst:>12}"
+        )
+
+    return lines
+
+
+def parse_trips(text: str) -> Dict[int, int]:
+    trips = {}
+    for item in text.split(","):
+        header, _, count = item.partition("=")
+        trips[int(header, 0)] = int(count)
+    return trips
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Static Cycle Estimator")
+    parser.add_argument("file")
+    # loop header ip=trip count, e.g. 0x9=64,0x6=64
+    parser.add_argument("--trips")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as file:
+        code = file.read()
+
+    reset_simulation()
+    load_code(code)
+    cfg = build_cfg(len(code))
+    costs = {start: estimate_block(block) for start, block in cfg.blocks.items()}
+    trips = parse_trips(args.trips) if args.trips else {}
+    loops = estimate_loops(cfg, costs, trips)
+
+    print(f"; {args.file}: {len(cfg.blocks)} blocks")
+    for line in format_cost_table(cfg, costs, loops):
+        print(line)
+
+    total = estimate_total(cfg, costs, loops)
+    if total is not None:
+        print(f"\ntotal: {total[0]} best, {total[1]} worst")
+
+
+if __name__ == "__main__":
+    main()
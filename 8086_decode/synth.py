@@ -0,0 +1,189 @@
+import argparse
+import random
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from decoder import (
+    IMM_TO_RM_LOCAL_OP_CODE,
+    INSTRUCTION_TYPE_TO_OP,
+    INSTRUCTION_TYPE_TO_OP_CODE,
+    JUMP_TYPES,
+    MODRM_TABLE,
+    OPCODE_TABLE,
+    SEG_REG_TYPES,
+    LengthClass,
+    OpcodeInfo,
+)
+from utils import InstructionType
+
+DEFAULT_SIZE = 4 * 1024 * 1024
+BATCH_SIZE = 4096
+
+LOOP_TYPES = (
+    InstructionType.LOOP,
+    InstructionType.LOOPZ,
+    InstructionType.LOOPNZ,
+    InstructionType.JCXZ,
+)
+
+LOCAL_OP_CODE_FOR = {
+    operation: local_op_code
+    for local_op_code, operation in IMM_TO_RM_LOCAL_OP_CODE.items()
+}
+
+
+class SyntheticStream(NamedTuple):
+    code: bytes
+    lengths: array
+    operations: List[InstructionType]
+
+
+# a variant is the fixed opcode (+ mod/reg/r_m) prefix and the number of
+# random displacement/immediate bytes that follow it
+Variant = Tuple[bytes, int]
+
+
+def get_family(operation: InstructionType) -> str:
+    if operation in LOOP_TYPES:
+        return "loop"
+    if operation in JUMP_TYPES:
+        return "jcc"
+    return INSTRUCTION_TYPE_TO_OP[operation]
+
+
+def get_modrm_bytes(operation: InstructionType) -> List[int]:
+    if operation in LOCAL_OP_CODE_FOR:
+        reg = LOCAL_OP_CODE_FOR[operation]
+        return [byte for byte in range(256) if MODRM_TABLE[byte].reg == reg]
+    if operation == InstructionType.MOV_IMM_MEM:
+        return [byte for byte in range(256) if MODRM_TABLE[byte].reg == 0]
+    if operation in SEG_REG_TYPES:
+        return [byte for byte in range(256) if MODRM_TABLE[byte].reg < 4]
+    return list(range(256))
+
+
+def get_immediate_size(byte: int, info: OpcodeInfo) -> int:
+    w_bit = (byte >> info.w_bit) & 1 if info.w_bit is not None else 0
+    if info.s_bit is not None and (byte >> info.s_bit) & 1:
+        return 1
+    return 2 if w_bit else 1
+
+
+def build_variants(operation: InstructionType) -> List[Variant]:
+    op_code = INSTRUCTION_TYPE_TO_OP_CODE[operation]
+    free_bits = 8 - len(op_code)
+    base = int(op_code, 2) << free_bits
+
+    variants = []
+    for low in range(1 << free_bits):
+        byte = base | low
+        info = OPCODE_TABLE[byte]
+        if info is None or info.operation not in (operation, None):
+            raise Exception(f"op_code {byte:08b} does not decode as {operation}")
+
+        if info.length_class in (LengthClass.REG_MEM, LengthClass.IMM_MEM):
+            for modrm_byte in get_modrm_bytes(operation):
+                tail = MODRM_TABLE[modrm_byte].displacement_size
+                if info.length_class == LengthClass.IMM_MEM:
+                    tail += get_immediate_size(byte, info)
+                variants.append((bytes([byte, modrm_byte]), tail))
+        elif info.length_class in (LengthClass.IMM_REG, LengthClass.ACC_IMM):
+            variants.append((bytes([byte]), get_immediate_size(byte, info)))
+        elif info.length_class in (LengthClass.MEM_ACC, LengthClass.ACC_MEM):
+            variants.append((bytes([byte]), 2))
+        else:
+            variants.append((bytes([byte]), 1))
+
+    return variants
+
+
+VARIANTS: Dict[InstructionType, List[Variant]] = {
+    operation: build_variants(operation) for operation in INSTRUCTION_TYPE_TO_OP_CODE
+}
+
+FAMILIES = sorted({get_family(operation) for operation in VARIANTS})
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        family, _, weight = item.partition("=")
+        if family not in FAMILIES:
+            raise Exception(f"unknown family: {family} (expected one of {FAMILIES})")
+        mix[family] = float(weight) if weight else 1.0
+    return mix
+
+
+def get_operation_weights(mix: Optional[Dict[str, float]]) -> Dict[InstructionType, float]:
+    if mix is None:
+        mix = {family: 1.0 for family in FAMILIES}
+
+    # a family's weight is split evenly across its instruction types
+    members = {family: 0 for family in FAMILIES}
+    for operation in VARIANTS:
+        members[get_family(operation)] += 1
+
+    return {
+        operation: mix.get(get_family(operation), 0.0) / members[get_family(operation)]
+        for operation in VARIANTS
+    }
+
+
+def generate(
+    size: int = DEFAULT_SIZE,
+    seed: int = 0,
+    mix: Optional[Dict[str, float]] = None,
+    coverage: bool = True,
+) -> SyntheticStream:
+    rng = random.Random(seed)
+    weights = get_operation_weights(mix)
+    operations = [operation for operation, weight in weights.items() if weight > 0]
+    if not operations:
+        raise Exception("instruction mix is empty")
+
+    code = bytearray()
+    lengths = array("B")
+    emitted = []
+
+    def emit(operation: InstructionType, variant: Variant):
+        prefix, tail = variant
+        code.extend(prefix)
+        code.extend(rng.randbytes(tail))
+        lengths.append(len(prefix) + tail)
+        emitted.append(operation)
+
+    if coverage:
+        # every opcode/mod/reg/r_m/w/s/d combination appears at least once
+        for operation in operations:
+            for variant in VARIANTS[operation]:
+                emit(operation, variant)
+
+    operation_weights = [weights[operation] for operation in operations]
+    while len(code) < size:
+        for operation in rng.choices(operations, operation_weights, k=BATCH_SIZE):
+            emit(operation, rng.choice(VARIANTS[operation]))
+            if len(code) >= size:
+                break
+
+    return SyntheticStream(bytes(code), lengths, emitted)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Instruction Stream Generator")
+    parser.add_argument("output")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix")
+    parser.add_argument("--no-coverage", action="store_true")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix) if args.mix else None
+    stream = generate(args.size, args.seed, mix, not args.no_coverage)
+    with open(args.output, "wb") as f:
+        f.write(stream.code)
+
+    print(f"{len(stream.lengths)} instructions, {len(stream.code)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import struct
+import sys
+from typing import BinaryIO, Dict, Iterator, Optional, TextIO, Tuple
+
+from decoder import (
+    Instruction,
+    decode_at,
+    decode_instruction,
+    execute_instruction,
+    format_instruction,
+    get_operation,
+)
+import simulation
+from simulation import (
+    RECORD_CYCLES,
+    RECORD_FLAG_DST,
+    RECORD_FLAG_OP,
+    RECORD_FLAG_RESULT,
+    RECORD_FLAG_SRC,
+    RECORD_KIND,
+    REGISTER_NAMES,
+    SIM_FLAGS,
+    STEP_BREAKDOWN,
+    STEP_FLAGS,
+    STEP_RECORD,
+    STEP_REG_WRITE,
+    STEP_SIMULATED,
+    get_ip_register,
+    get_memory_view,
+    pack_flags,
+    set_ip_register,
+)
+
+TRACE_MAGIC = b"8086TRC3"
+# packed flags when the trace starts
+TRACE_HEADER = struct.Struct("<B")
+TRACE_BUFFER_SIZE = 1024 * 1024
+# ip, next ip, length, instruction bytes, then the STEP_RECORD fields:
+# kind, register, old value, new value, flag op, flag dst, flag src,
+# flag result, memory address, memory value, old memory value, cycles,
+# ea cycles
+TRACE_RECORD = struct.Struct("<HHB6sBBHHBHHHIHHHB")
+STEP_RECORD_OFFSET = 4
+FLAG_NAMES = list(SIM_FLAGS)
+
+
+class TraceWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "wb", buffering=TRACE_BUFFER_SIZE)
+        self.file.write(TRACE_MAGIC)
+        self.file.write(TRACE_HEADER.pack(pack_flags()))
+
+    def write(self, ip: int, next_ip: int, code: bytes):
+        self.file.write(TRACE_RECORD.pack(ip, next_ip, len(code), code, *STEP_RECORD))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_traced(
+    code_length: int, path: str, max_instructions: Optional[int] = None
+) -> int:
+    steps = 0
+    current_ip, _ = get_ip_register()
+    memory_view = get_memory_view()
+    # ip -> (instruction, its bytes); a re-decoded instruction is a new object
+    code_bytes: Dict[int, Tuple[Instruction, bytes]] = {}
+
+    with TraceWriter(path) as writer:
+        write = writer.file.write
+        pack = TRACE_RECORD.pack
+        while current_ip < code_length:
+            if max_instructions is not None and steps >= max_instructions:
+                break
+
+            instruction = decode_at(current_ip, use_cache=True)
+            entry = code_bytes.get(current_ip)
+            if entry is None or entry[0] is not instruction:
+                end = current_ip + instruction.length
+                entry = code_bytes[current_ip] = (
+                    instruction,
+                    memory_view[current_ip:end].tobytes(),
+                )
+            set_ip_register(current_ip + instruction.length)
+
+            STEP_RECORD[RECORD_KIND] = 0
+            STEP_RECORD[RECORD_CYCLES] = 0
+            execute_instruction(instruction, trace=False, record=True)
+
+            next_ip, _ = get_ip_register()
+            write(pack(current_ip, next_ip, instruction.length, entry[1], *STEP_RECORD))
+            current_ip = next_ip
+            steps += 1
+
+    return steps
+
+
+def read_trace_header(file: BinaryIO) -> int:
+    if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+        raise Exception("not an 8086 trace file")
+    return TRACE_HEADER.unpack(file.read(TRACE_HEADER.size))[0]
+
+
+def read_trace(file: BinaryIO) -> Iterator[Tuple]:
+    # returns the records that follow read_trace_header
+
+    chunk_size = TRACE_RECORD.size * (TRACE_BUFFER_SIZE // TRACE_RECORD.size)
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        if len(data) % TRACE_RECORD.size:
+            raise Exception("truncated trace record")
+        yield from TRACE_RECORD.iter_unpack(data)
+
+
+def format_packed_flags(packed: int) -> str:
+    return "".join(name for bit, name in enumerate(FLAG_NAMES) if packed & (1 << bit))
+
+
+def compute_flags(record: Tuple) -> int:
+    # replays the pending flags of a STEP_FLAGS record through the simulator,
+    # so rendering overwrites the live flags
+    flag_op = record[STEP_RECORD_OFFSET + RECORD_FLAG_OP]
+    simulation.PENDING_FLAGS = (
+        flag_op & 1,
+        record[STEP_RECORD_OFFSET + RECORD_FLAG_DST],
+        record[STEP_RECORD_OFFSET + RECORD_FLAG_SRC],
+        record[STEP_RECORD_OFFSET + RECORD_FLAG_RESULT],
+        bool(flag_op & 2),
+    )
+    return pack_flags()
+
+
+def render_record(
+    record: Tuple, total_cycles: int, flags_before: int, flags_after: int
+) -> str:
+    (
+        ip,
+        _,
+        length,
+        code,
+        kind,
+        reg,
+        reg_old,
+        reg_new,
+        *_,
+        cycles,
+        ea_cycles,
+    ) = record
+
+    chunk = code[:length]
+    text = format_instruction(decode_instruction(chunk, get_operation(chunk)))
+    if kind & STEP_REG_WRITE:
+        text += f" ; {REGISTER_NAMES[reg]}:0x{reg_old:04x}->0x{reg_new:04x}"
+
+    if not kind & STEP_SIMULATED:
+        return text
+
+    text += f" ; Clocks: +{cycles} = {total_cycles}"
+    if kind & STEP_BREAKDOWN:
+        text += f" ({cycles - ea_cycles} + {ea_cycles}ea)"
+
+    text += f" | ip:{ip:#04x}->{ip + length:#04x}"
+
+    if kind & STEP_FLAGS and flags_before != flags_after:
+        before = format_packed_flags(flags_before)
+        after = format_packed_flags(flags_after)
+        text += f" flags:{before}->{after}"
+
+    return text
+
+
+def render_trace(file: BinaryIO, out: TextIO):
+    total_cycles = 0
+    flags = read_trace_header(file)
+    for record in read_trace(file):
+        total_cycles += record[STEP_RECORD_OFFSET + RECORD_CYCLES]
+        flags_before = flags
+        if record[STEP_RECORD_OFFSET + RECORD_KIND] & STEP_FLAGS:
+            flags = compute_flags(record)
+        out.write(render_record(record, total_cycles, flags_before, flags))
+        out.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="8086 Trace Renderer")
+    parser.add_argument("trace")
+    args = parser.parse_args()
+
+    with open(args.trace, "rb") as file:
+        render_trace(file, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
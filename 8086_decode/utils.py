@@ -1,4 +1,9 @@
+import glob
+import os
 from enum import Enum
+from typing import List
+
+PROBLEMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "problems")
 
 
 def read_le16(low_byte: int, high_byte: int) -> int:
@@ -15,6 +20,22 @@ def to_signed(value: int, bits: int) -> int:
     return value
 
 
+def find_listings(paths: List[str]) -> List[str]:
+    # listing binaries are the files without an extension; a directory means
+    # every listing in it, no paths every listing in problems/
+    if not paths:
+        paths = [os.path.join(PROBLEMS_DIR, "listing_*")]
+
+    listings = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, "*")
+        for match in sorted(glob.glob(path)):
+            if os.path.isfile(match) and "." not in os.path.basename(match):
+                listings.append(match)
+    return listings
+
+
 class InstructionType(str, Enum):
     MOV = "MOV"
     MOV_IMM = "MOV_IMM"